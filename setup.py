@@ -66,6 +66,12 @@ setup(
     ],
     keywords=['tidy'],
     install_requires=[],
+    entry_points={
+        'console_scripts': [
+            'tidy-includes = tidycxx.batch:main',
+            'tidy-copyright = tidycxx.copyright:main',
+        ],
+    },
     extras_require={
         # 'dev': ['check-manifest'],
         'test': ['pytest'],
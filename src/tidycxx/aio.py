@@ -0,0 +1,114 @@
+""" Asyncio driver overlapping file I/O with include arranging.
+
+    Reading, arranging and writing back run as three stages connected by bounded queues. File I/O is performed in the
+    loop's default (thread) executor, while the CPU-bound arranging is dispatched to a separate executor (a process pool
+    by default). Thus, on slow storage (eg. NFS) the latency of open/read/write is hidden behind parsing.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+
+from . import batch
+from . import includes
+
+
+def _read(path):
+    with open(path, 'r') as code:
+        return code.read()
+
+
+async def _run_stage(source, sink, num_workers, process):
+    """ Apply coroutine process on items of source queue with num_workers concurrent workers, put results into sink.
+
+        Either queue uses None as end marker, which is forwarded to sink once all workers have finished.
+    """
+    async def worker():
+        while True:
+            item = await source.get()
+            if item is None:
+                await source.put(None)  # Wake up the other workers
+                return
+            result = await process(item)
+            if sink is not None:
+                await sink.put(result)
+
+    await asyncio.gather(*[worker() for _ in range(num_workers)])
+    if sink is not None:
+        await sink.put(None)
+
+
+async def arrange_files_async(paths, git_root=None, include_sequence=None, include_apply=None, executor=None,
+                              num_parsers=None, prefetch=8, io_workers=4, in_place=True):
+    """ Arrange the includes of all paths concurrently.
+
+    :param paths: Iterable of files to process.
+    :param git_root: See IncludeArranger (determined once via git if omitted).
+    :param include_sequence: See IncludeArranger. Must be picklable if executor is a process pool.
+    :param include_apply: See IncludeArranger. Must be picklable if executor is a process pool.
+    :param executor: Executor for arranging the files (defaults to a process pool).
+    :param num_parsers: Number of files handed to executor simultaneously (defaults to the number of CPUs).
+    :param prefetch: Maximal number of files read ahead (resp. waiting to be written back).
+    :param io_workers: Number of concurrent reads and writes each.
+    :param in_place: Whether to write back modified files.
+    :return: Mapping path -> status (see batch). A file failing to be read, arranged or written gets an error status,
+             without affecting the other files.
+    """
+    if not git_root:
+        git_root = includes.find_git_root()
+    loop = asyncio.get_running_loop()
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ProcessPoolExecutor()
+
+    path_queue = asyncio.Queue()
+    read_queue = asyncio.Queue(maxsize=prefetch)
+    write_queue = asyncio.Queue(maxsize=prefetch)
+    statuses = {}
+
+    async def read(path):
+        try:
+            return path, await loop.run_in_executor(None, _read, path)
+        except Exception as e:
+            statuses[path] = batch.error_status(e)
+            return path, None
+
+    async def arrange(item):
+        path, code = item
+        if code is None:
+            return path, None
+        try:
+            result = await loop.run_in_executor(executor, includes.arrange_code, code, path, git_root,
+                                                include_sequence, include_apply)
+        except Exception as e:
+            statuses[path] = batch.error_status(e)
+            return path, None
+        statuses[path] = batch.TIDY if result == code else batch.CHANGED
+        return path, result
+
+    async def write(item):
+        path, result = item
+        if in_place and statuses[path] == batch.CHANGED:
+            try:
+                await loop.run_in_executor(None, includes.write_atomic, path, result)
+                statuses[path] = batch.FIXED
+            except Exception as e:
+                statuses[path] = batch.error_status(e)
+
+    for path in paths:
+        path_queue.put_nowait(path)
+    path_queue.put_nowait(None)
+    try:
+        await asyncio.gather(
+            _run_stage(path_queue, read_queue, io_workers, read),
+            _run_stage(read_queue, write_queue, num_parsers or os.cpu_count() or 1, arrange),
+            _run_stage(write_queue, None, io_workers, write))
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return statuses
+
+
+def arrange_files(paths, **kwargs):
+    """ Synchronous wrapper of arrange_files_async; see there. """
+    return asyncio.run(arrange_files_async(paths, **kwargs))
@@ -0,0 +1,361 @@
+""" Batch entry point tidying (or checking) whole trees, optionally split into shards for distributed runs.
+
+    Usage:
+        python -m tidycxx.batch run [--check] [--shard K/N] [--report FILE] [--journal FILE] PATH...
+        python -m tidycxx.batch diff [--format unified|edits] PATH...
+        python -m tidycxx.batch merge REPORT...
+
+    Files are assigned to shards either by a stable hash of their path or, balancing the amount of work, by their size.
+    Each shard writes a JSON report; merging all reports yields a single pass/fail result. With a journal, interrupted
+    runs resume where they stopped. Files are always replaced atomically, so no partially written files are left behind;
+files with several hard links are reported as errors rather than replaced.
+"""
+
+# Like includes, this is the entry point of short-lived hook invocations: modules only needed for parallel runs,
+# journals or reports (eg. concurrent.futures, which loads logging) are imported where they're used.
+import argparse
+import os
+import sys
+import time
+import zlib
+
+from . import includes
+from .files import scan
+
+# Status of a processed file; STALE files were modified by someone else while being processed and were left untouched
+TIDY, CHANGED, FIXED, ERROR, STALE = 'tidy', 'changed', 'fixed', 'error', 'stale'
+FAILING = (CHANGED, ERROR)
+
+
+def parse_shard(text):
+    """ Parse shard specification 'K/N' (1 <= K <= N) into tuple (K, N). """
+    try:
+        shard, num_shards = [int(part) for part in text.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('Expected K/N, got %r' % text)
+    if not 1 <= shard <= num_shards:
+        raise argparse.ArgumentTypeError('Expected 1 <= K <= N, got %r' % text)
+    return shard, num_shards
+
+
+def select_shard(files, shard, num_shards, balance='hash', key=None):
+    """ Return the paths of files (list of (path, size)) belonging to shard K of N.
+
+        With balance 'hash', files are assigned by a stable hash of their key. With balance 'size', files are
+        distributed greedily (largest first, ties broken by key) to the shard with the least amount of bytes so far.
+        Either way, the assignment only depends on the files' keys and sizes, so all shards agree on it.
+
+    :param key: Callable returning the key of a path (default: the path itself), eg. the get method of the keys
+        returned by scan_keyed, to agree with shards run in checkouts in other folders.
+    """
+    key = key or (lambda path: path)
+    if balance == 'hash':
+        return sorted(path for path, _ in files if zlib.crc32(key(path).encode('utf8')) % num_shards == shard - 1)
+    elif balance == 'size':
+        loads = [0] * num_shards
+        selected = []
+        for path, size in sorted(files, key=lambda f: (-f[1], key(f[0]), f[0])):
+            target = loads.index(min(loads))
+            loads[target] += size
+            if target == shard - 1:
+                selected.append(path)
+        return sorted(selected)
+    raise ValueError('Unknown balance %r' % balance)
+
+
+def scan_keyed(paths):
+    """ Return the files found in paths like scan, along with dict mapping them to shard keys: their path relative to
+        the element of paths they were found in (or their name, for files given directly). Unlike the paths, the keys
+        don't depend on the folder of the checkout.
+    """
+    files, keys = [], {}
+    for root in paths:
+        folder = root if os.path.isdir(root) else (os.path.dirname(root) or os.curdir)
+        for path, size in scan([root]):
+            files.append((path, size))
+            keys.setdefault(path, os.path.relpath(path, folder))
+    return sorted(files), keys
+
+
+class IncludeTool(object):
+    """ Arrange the includes of a single file, returning the file's status. Picklable, ie. usable by worker processes.
+    """
+
+    def __init__(self, git_root, include_sequence=None):
+        self.git_root = git_root
+        self.include_sequence = include_sequence
+
+    def __call__(self, path, in_place, unchanged=None):
+        """ Process path; if given, unchanged is called right before replacing path and must return whether path
+            is still in the state it was read in (otherwise it's left untouched and reported STALE).
+        """
+        with open(path, 'r') as src:
+            code = src.read()
+        result = includes.arrange_code(code, path, self.git_root, include_sequence=self.include_sequence)
+        if result == code:
+            return TIDY
+        elif not in_place:
+            return CHANGED
+        elif unchanged and not unchanged():
+            return STALE
+        includes.write_atomic(path, result)
+        return FIXED
+
+
+class DiffTool(IncludeTool):
+    """ Compute the changes arranging a file's includes, formatted as unified diff or as JSON list of edits. """
+
+    def __init__(self, git_root, include_sequence=None, diff_format='unified'):
+        IncludeTool.__init__(self, git_root, include_sequence=include_sequence)
+        self.diff_format = diff_format
+
+    def __call__(self, path):
+        with open(path, 'r') as src:
+            lines = src.readlines()
+        edits = includes.arrange_edits(lines, path, self.git_root, include_sequence=self.include_sequence)
+        if self.diff_format == 'unified':
+            return includes.unified_diff(lines, edits, path)
+        import json
+        return ''.join(json.dumps(dict(edit.to_dict(), path=path)) + '\n' for edit in edits)
+
+
+def file_digest(path):
+    import hashlib
+    with open(path, 'rb') as src:
+        return hashlib.sha1(src.read()).hexdigest()
+
+
+class Journal(object):
+    """ Append-only record of completed files, allowing interrupted runs to resume.
+
+        Every line holds the digest of a file's content once it was completed, its status and its path. A file is
+        considered done iff its current content still has the recorded digest.
+    """
+
+    def __init__(self, journal_file):
+        self.entries = {}  # path -> (digest, status)
+        if os.path.exists(journal_file):
+            with open(journal_file, 'r') as src:
+                for line in src:
+                    parts = line.rstrip('\n').split('\t', 2)
+                    if len(parts) == 3:  # Ignore a truncated last line
+                        digest, status, path = parts
+                        self.entries[path] = (digest, status)
+        self._out = open(journal_file, 'a')
+
+    def close(self):
+        self._out.close()
+
+    def record(self, path, digest, status):
+        self.entries[path] = (digest, status)
+        self._out.write('%s\t%s\t%s\n' % (digest, status, path))
+        self._out.flush()
+
+
+class Progress(object):
+    """ Report the number of processed files, their rate and an estimate of the remaining time (at most every
+        interval seconds).
+    """
+
+    def __init__(self, total, stream=sys.stderr, interval=1.0):
+        self.total = total
+        self.done = 0
+        self.stream = stream
+        self.interval = interval
+        self._start = self._last = time.time()
+
+    def update(self, num=1):
+        self.done += num
+        now = time.time()
+        if now - self._last >= self.interval or self.done == self.total:
+            self._last = now
+            rate = self.done / max(now - self._start, 1e-9)
+            eta = (self.total - self.done) / rate if rate else 0
+            self.stream.write('\r%d/%d files, %.1f files/s, ETA %ds' % (self.done, self.total, rate, eta))
+            if self.done == self.total:
+                self.stream.write('\n')
+            self.stream.flush()
+
+
+def error_status(error):
+    """ Return the status of a file whose processing raised error. """
+    return '%s: %s: %s' % (ERROR, type(error).__name__, error)
+
+
+def _process(tool, path, in_place, journaled=False, known=None):
+    """ Apply tool to path, return tuple of status and (if journaled) the digest of the completed file.
+
+        If known, ie. the journal's (digest, status) of path, matches the file's content, the tool isn't run.
+    """
+    try:
+        digest = file_digest(path) if journaled else None
+        if known and known[0] == digest:
+            return known[1], digest
+        status = tool(path, in_place)
+        if journaled and status == FIXED:
+            digest = file_digest(path)
+        return status, digest
+    except Exception as e:
+        return error_status(e), None
+
+
+def run(tool, paths, in_place=False, jobs=1, journal=None, progress=None):
+    """ Apply tool to all paths (using jobs processes) and return mapping path -> status.
+
+    :param journal: Journal recording completed files; files completed before (and unchanged since) are skipped.
+    :param progress: Progress to update after every file.
+    """
+    journaled = journal is not None
+    known = [journal.entries.get(path) if journaled else None for path in paths]
+    args = [[tool] * len(paths), paths, [in_place] * len(paths), [journaled] * len(paths), known]
+    executor = None
+    if jobs != 1:
+        import concurrent.futures
+        executor = concurrent.futures.ProcessPoolExecutor(jobs)
+    try:
+        results = executor.map(_process, *args, chunksize=4) if executor else map(_process, *args)
+        statuses = {}
+        for path, (status, digest) in zip(paths, results):
+            statuses[path] = status
+            if journaled and digest and not is_failing(status):
+                journal.record(path, digest, status)
+            if progress:
+                progress.update()
+        return statuses
+    finally:
+        if executor:
+            executor.shutdown()
+
+
+def is_failing(status):
+    return status.split(':', 1)[0] in FAILING
+
+
+def make_report(statuses, shard=(1, 1)):
+    return {'shard': list(shard), 'files': statuses, 'failed': sum(is_failing(s) for s in statuses.values())}
+
+
+def merge_reports(reports):
+    """ Combine the reports of all shards into a single one; missing shards are reported in 'missing_shards'.
+
+        Raises ValueError if the reports disagree on the number of shards or several reports are of the same shard.
+    """
+    num_shards = set(r['shard'][1] for r in reports) or {1}
+    if len(num_shards) > 1:
+        raise ValueError('Reports of different numbers of shards: %s' % ', '.join(str(n) for n in sorted(num_shards)))
+    num_shards = num_shards.pop()
+    shards = [r['shard'][0] for r in reports]
+    repeated = sorted(set(shard for shard in shards if shards.count(shard) > 1))
+    if repeated:
+        raise ValueError('Several reports of shards %s' % ', '.join(str(shard) for shard in repeated))
+    statuses = {}
+    for report in reports:
+        statuses.update(report['files'])
+    merged = make_report(statuses, shard=(1, 1))
+    merged['missing_shards'] = sorted(set(range(1, num_shards + 1)) - set(r['shard'][0] for r in reports))
+    return merged
+
+
+def add_tool_arguments(parser):
+    """ Add arguments common to all batch tools to the argparse parser. """
+    parser.add_argument('paths', nargs='+', help='Files or folders to process')
+    parser.add_argument('--check', action='store_true', help='Only report files needing changes; modify nothing')
+    parser.add_argument('--shard', type=parse_shard, default=(1, 1), help='Only process shard K of N (eg. 2/8)')
+    parser.add_argument('--balance', choices=['hash', 'size'], default='hash', help='How to assign files to shards')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of worker processes')
+    parser.add_argument('--report', help='Write JSON report to this file (for merging shards)')
+    parser.add_argument('--journal', help='Record completed files in this file and skip files completed before')
+    parser.add_argument('--progress', action='store_true', help='Report progress on stderr')
+
+
+def run_tool(tool, args):
+    """ Run tool as specified by the arguments added in add_tool_arguments, return the exit code. """
+    files, keys = scan_keyed(args.paths)
+    files = select_shard(files, *args.shard, balance=args.balance, key=keys.get)
+    journal = Journal(args.journal) if args.journal else None
+    progress = Progress(len(files)) if args.progress else None
+    try:
+        statuses = run(tool, files, in_place=not args.check, jobs=args.jobs, journal=journal, progress=progress)
+    finally:
+        if journal:
+            journal.close()
+    report = make_report(statuses, shard=args.shard)
+    if args.report:
+        import json
+        with open(args.report, 'w') as out:
+            json.dump(report, out, indent=1, sort_keys=True)
+    return _print_summary(report)
+
+
+def _print_summary(report):
+    for path, status in sorted(report['files'].items()):
+        if status != TIDY:
+            print('%s: %s' % (path, status))
+    if report.get('missing_shards'):
+        print('Missing reports of shards %s' % ', '.join(str(s) for s in report['missing_shards']))
+    failed = report['failed'] or report.get('missing_shards')
+    print('%s: %d files, %d failed' % ('FAIL' if failed else 'PASS', len(report['files']), report['failed']))
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Arrange the includes of many C/C++ files.')
+    commands = parser.add_subparsers(dest='command')
+    run_parser = commands.add_parser('run', help='Arrange (or check) includes')
+    add_tool_arguments(run_parser)
+    run_parser.add_argument('--config', help='JSON file describing the include ordering')
+    run_parser.add_argument('--git-root', help='Root folder of the project')
+    diff_parser = commands.add_parser('diff', help='Print the changes arranging includes would make')
+    diff_parser.add_argument('paths', nargs='+', help='Files or folders to process')
+    diff_parser.add_argument('--format', choices=['unified', 'edits'], default='unified',
+                             help='Unified diff or JSON lines with path, line range (start, end) and replacement text')
+    diff_parser.add_argument('--jobs', type=int, default=1, help='Number of worker processes')
+    diff_parser.add_argument('--config', help='JSON file describing the include ordering')
+    diff_parser.add_argument('--git-root', help='Root folder of the project')
+    merge_parser = commands.add_parser('merge', help='Merge shard reports into a single pass/fail result')
+    merge_parser.add_argument('reports', nargs='+', help='JSON reports written by the shards')
+    merge_parser.add_argument('--report', help='Write the merged JSON report to this file')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        sequencer = includes.IncludeSequencer.from_file(args.config) if args.config else None
+        tool = IncludeTool(args.git_root or includes.find_git_root(), include_sequence=sequencer)
+        return run_tool(tool, args)
+    elif args.command == 'diff':
+        sequencer = includes.IncludeSequencer.from_file(args.config) if args.config else None
+        tool = DiffTool(args.git_root or includes.find_git_root(), include_sequence=sequencer,
+                        diff_format=args.format)
+        paths = [path for path, _ in scan(args.paths)]
+        executor = None
+        if args.jobs != 1:
+            import concurrent.futures
+            executor = concurrent.futures.ProcessPoolExecutor(args.jobs)
+        try:
+            changed = 0
+            for diff in (executor.map(tool, paths, chunksize=4) if executor else map(tool, paths)):
+                sys.stdout.write(diff)
+                changed += bool(diff)
+        finally:
+            if executor:
+                executor.shutdown()
+        return 1 if changed else 0
+    elif args.command == 'merge':
+        import json
+        reports = []
+        for name in args.reports:
+            with open(name, 'r') as src:
+                reports.append(json.load(src))
+        try:
+            merged = merge_reports(reports)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.report:
+            with open(args.report, 'w') as out:
+                json.dump(merged, out, indent=1, sort_keys=True)
+        return _print_summary(merged)
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
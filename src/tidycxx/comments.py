@@ -5,7 +5,7 @@ class CommentParser(object):
 
     def __init__(self):
         self.in_old_comment = False
-        self.old_comment_buffer = ''
+        self.old_comment_buffer = []  # Lines of the current /* ... */ comment (joined once it's complete)
 
     def _handle_code(self, code):
         if code:  # if there is no code to handle, don't handle it!
@@ -21,6 +21,7 @@ class CommentParser(object):
             :param input_line: Next line to digest
             :return: None
         """
+        self.handle_input_line(input_line)
         input_line = input_line.strip('\n')
         while True:
             matches = re.match(r'(?P<text>.*?)(?P<delimiter>' + ('\*/' if self.in_old_comment else '//|/\*')
@@ -30,8 +31,9 @@ class CommentParser(object):
 
             input_line = matches.group('else')
             if self.in_old_comment:
-                self.handle_old_comment(self.old_comment_buffer + matches.group('text'))
-                self.old_comment_buffer = ''
+                self.old_comment_buffer.append(matches.group('text'))
+                self.handle_old_comment(''.join(self.old_comment_buffer))
+                self.old_comment_buffer = []
                 self.in_old_comment = False
             else:
                 self._handle_code(matches.group('text'))
@@ -44,12 +46,16 @@ class CommentParser(object):
 
         # Handle stuff at end of line, ie. block not delimited by (eg. '*/') in this line
         if self.in_old_comment:
-            self.old_comment_buffer += input_line + '\n'
+            self.old_comment_buffer.append(input_line + '\n')
         else:
             self._handle_code(input_line)
             self.handle_end_of_line()
 
 
+    def handle_input_line(self, input_line):
+        """ Called with each line fed (as is), before any of the handlers of its pieces. """
+        pass
+
     def handle_code(self, code):
         print('CPP', '_%s_' % code)
 
@@ -66,3 +72,7 @@ class CommentParser(object):
 
     def handle_end_of_line(self):
         print('EOL')
+
+    def finish(self):
+        """ Called once after the last line of input was fed. """
+        pass
@@ -0,0 +1,168 @@
+""" Fixer for copyright banners at the top of C/C++ files.
+
+    Only the leading comment region of a file (everything before the first line containing code) is inspected; reading
+    stops as soon as code starts. If the region contains a copyright notice of the holder, its years are extended up to
+    the current year (eg. '2019' -> '2019-2026', '2019-2024' -> '2019-2026'). Otherwise a banner generated from a
+    template is inserted at the top. The rest of the file is only read when it has to be copied to a modified file.
+    Alternatively, BannerTool.rewriter adds the fixer to a passes.Pipeline, sharing its read and write of each file
+    with other rewriters (eg. arranging includes).
+
+    Usage:
+        python -m tidycxx.copyright --holder HOLDER [--template FILE] [--year YEAR] [batch options] PATH...
+"""
+
+import argparse
+import io
+import re
+import shutil
+import sys
+import time
+
+from . import batch
+from . import comments
+from . import includes
+
+DEFAULT_TEMPLATE = '// Copyright (c) {years} {holder}\n'
+
+
+class _LeadingRegionParser(comments.CommentParser):
+    """ Parser collecting the lines (see region) and comments it's fed until the first line containing code. """
+
+    def __init__(self):
+        comments.CommentParser.__init__(self)
+        self.region = []
+        self.comments = []
+        self.code_found = False
+        self._num_comments = 0  # Number of comments before the current line
+
+    def handle_input_line(self, input_line):
+        if not self.code_found:
+            self._num_comments = len(self.comments)
+            self.region.append(input_line)
+
+    def handle_code(self, code):
+        if code.strip() and not self.code_found:
+            self.code_found = True
+            self.region.pop()
+            del self.comments[self._num_comments:]
+
+    def handle_old_comment(self, comment):
+        if not self.code_found:
+            self.comments.append(comment)
+
+    def handle_new_comment(self, comment):
+        if not self.code_found:
+            self.comments.append(comment)
+
+    def handle_end_of_line(self):
+        pass
+
+
+class _BannerPass(_LeadingRegionParser):
+    """ Rewriting pass (see passes.Pipeline) fixing the banner of the leading region via tool. """
+
+    def __init__(self, tool):
+        _LeadingRegionParser.__init__(self)
+        self.tool = tool
+        self.edits = []
+
+    def finish(self):
+        fixed = self.tool.fix_region(self.region, self.comments)
+        if fixed != self.region:
+            self.edits = [includes.Edit(1, self.region, ''.join(fixed))]
+
+
+def read_leading_region(src):
+    """ Read lines of the open file src up to the first line containing code.
+
+    :return: Tuple of the leading lines (without code), their comments and the first line with code ('' at the end of
+             the file). src is positioned right after the latter.
+    """
+    parser = _LeadingRegionParser()
+    for line in src:
+        parser.feed(line)
+        if parser.code_found:
+            return parser.region, parser.comments, line
+    return parser.region, parser.comments, ''
+
+
+class BannerTool(object):
+    """ Insert or update the copyright banner of a single file, returning the file's status (see batch). Picklable. """
+
+    def __init__(self, holder, template=DEFAULT_TEMPLATE, year=None):
+        self.holder = holder
+        self.template = template
+        self.year = year or time.localtime().tm_year
+        self._notice = re.compile(r'(?i)copyright\s+(?:\(c\)\s*)?(?P<years>\d{4}(?:\s*[-,]\s*\d{4})*)\s+'
+                                  + re.escape(holder))
+        self._last_year = re.compile(r'(?P<separator>\s*-\s*)?(?P<year>\d{4})$')
+        if not self._notice.search(self.banner()):
+            raise ValueError('Banner %r lacks a copyright notice of %s; it would be inserted over and over again'
+                             % (self.banner(), holder))
+
+    def banner(self):
+        banner = self.template.format(years=self.year, holder=self.holder)
+        return banner if banner.endswith('\n') else banner + '\n'
+
+    def _updated_years(self, years):
+        last = self._last_year.search(years)
+        if int(last.group('year')) >= self.year:
+            return years
+        if last.group('separator'):  # Extend range
+            return years[:last.start('year')] + str(self.year)
+        return '%s-%d' % (years, self.year)
+
+    def fix_region(self, region, comments):
+        """ Return the fixed leading region (list of lines) of a file, given the comments contained in it. """
+        if not any(self._notice.search(comment) for comment in comments):
+            banner = self.banner()
+            separator = ['\n'] if region and region[0].strip() else []
+            return [banner] + separator + region if region else [banner, '\n']
+
+        text = ''.join(region)
+        notice = self._notice.search(text)
+        if not notice:  # Notice spread over several comments in a single line; leave it alone
+            return region
+        years = self._updated_years(notice.group('years'))
+        text = text[:notice.start('years')] + years + text[notice.end('years'):]
+        return io.StringIO(text, newline='\n').readlines()  # Unlike str.splitlines, keep form feeds etc. in place
+
+    def rewriter(self, original_name):
+        """ Create a pass fixing the banner within a passes.Pipeline (see Pipeline.add_rewriter). """
+        return _BannerPass(self)
+
+    def __call__(self, path, in_place, unchanged=None):
+        """ Process path like batch.IncludeTool. """
+        with open(path, 'r') as src:
+            region, found_comments, code_line = read_leading_region(src)
+            fixed = self.fix_region(region, found_comments)
+            if fixed == region:
+                return batch.TIDY
+            elif not in_place:
+                return batch.CHANGED
+            elif unchanged and not unchanged():
+                return batch.STALE
+            with includes.atomic_open(path) as out:
+                out.writelines(fixed)
+                out.write(code_line)
+                shutil.copyfileobj(src, out)
+        return batch.FIXED
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Insert or update copyright banners of many C/C++ files.')
+    batch.add_tool_arguments(parser)
+    parser.add_argument('--holder', required=True, help='Copyright holder')
+    parser.add_argument('--template', help='File with the banner to insert; may use {years} and {holder}')
+    parser.add_argument('--year', type=int, help='Year to extend notices to (default: current year)')
+    args = parser.parse_args(argv)
+
+    template = DEFAULT_TEMPLATE
+    if args.template:
+        with open(args.template, 'r') as src:
+            template = src.read()
+    return batch.run_tool(BannerTool(args.holder, template=template, year=args.year), args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,41 @@
+""" Discovery of the C/C++ files to process.
+
+    Kept free of heavy imports, since it's on the path of every (short-lived) hook invocation.
+"""
+
+import os
+
+SOURCE_EXTENSIONS = ('.c', '.C', '.cc', '.cpp', '.cxx', '.c++')
+HEADER_EXTENSIONS = ('.h', '.H', '.hh', '.hpp', '.hxx', '.h++', '.inl')
+
+
+def walk(paths, extensions=SOURCE_EXTENSIONS + HEADER_EXTENSIONS, missing_ok=False):
+    """ Yield (path, os.stat_result) of all files given in paths or contained in folders of paths (in no fixed order).
+
+        Folders are scanned recursively (skipping hidden ones and not following symbolic links to folders, which might
+        form loops), taking the file information from the directory scan itself.
+
+    :param missing_ok: Skip files given in paths that don't exist (instead of raising FileNotFoundError).
+    """
+    todo = list(paths)
+    while todo:
+        path = todo.pop()
+        if not os.path.isdir(path):
+            try:
+                yield path, os.stat(path)
+            except FileNotFoundError:
+                if not missing_ok:
+                    raise
+            continue
+        for entry in os.scandir(path):
+            if entry.name.startswith('.'):
+                continue
+            elif entry.is_dir(follow_symlinks=False):
+                todo.append(entry.path)
+            elif os.path.splitext(entry.name)[1] in extensions:
+                yield entry.path, entry.stat()
+
+
+def scan(paths, extensions=SOURCE_EXTENSIONS + HEADER_EXTENSIONS):
+    """ Return sorted list of (path, size) of all files given in paths or contained in folders of paths (see walk). """
+    return sorted((path, info.st_size) for path, info in walk(paths, extensions))
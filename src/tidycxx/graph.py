@@ -0,0 +1,363 @@
+""" Tree-wide include graph, built from the includes IncludeArranger discovers in every file.
+
+    Paths are interned to integer ids; the edges are stored as adjacency arrays (edges of node n are
+    targets[offsets[n]:offsets[n + 1]]). Includes are resolved relative to the including file (for relative includes)
+    and the include directories (default: the root of the tree). Includes that can't be resolved (eg. <iostream>) are
+    kept as external nodes of size 0.
+"""
+
+import argparse
+import array
+import bisect
+import collections
+import json
+import os
+import re
+
+from . import comments
+from . import files
+from . import includes
+from .files import SOURCE_EXTENSIONS
+
+
+class _IncludeCollector(includes.IncludeArranger):
+    """ IncludeArranger recording the prepared includes of every block instead of printing the arranged code. """
+
+    def __init__(self, git_root, original_name, include_sequence=None, include_apply=None):
+        includes.IncludeArranger.__init__(self, git_root, original_name, include_sequence=include_sequence,
+                                          include_apply=include_apply)
+        self.found = []  # List of (include, relative)
+        self._quoted = set()  # Includes of the current block written as "...", whichever bucket they're sorted into
+
+    def _write(self, text):
+        pass
+
+    def _store_buffer(self):
+        if self._buffer.relative:
+            self._quoted.add(self._buffer.include)
+        includes.IncludeArranger._store_buffer(self)
+
+    def _print_cached(self):
+        self._prepare_includes()
+        self.found.extend((i, True) for i in [self.mother] if i)
+        self.found.extend((i, False) for i in self.sys_includes)
+        self.found.extend((i, i in self._quoted) for i in self.abs_includes)  # eg. "detail/impl.H"
+        self.found.extend((i, True) for i in self.rel_includes)
+        self._quoted.clear()
+
+
+def collect_includes(path, git_root, include_sequence=None, include_apply=None):
+    """ Return list of (include, relative) of all includes in file path, where relative marks "..." includes. """
+    collector = _IncludeCollector(git_root, path, include_sequence=include_sequence, include_apply=include_apply)
+    with open(path, 'r') as code:
+        for line in code:
+            collector.feed(line)
+    collector.finish()
+    return collector.found
+
+
+class _IncludeLines(comments.CommentParser):
+    """ CommentParser recording the includes standing on a line of their own (comments within the line allowed). """
+
+    def __init__(self):
+        comments.CommentParser.__init__(self)
+        self.found = []  # List of (line number, include, relative)
+        self._line_number = 0
+        self._code = []
+        self._in_comment_at_start = False
+
+    def handle_input_line(self, input_line):
+        self._line_number += 1
+        self._code = []
+        self._in_comment_at_start = self.in_old_comment
+
+    def handle_code(self, code):
+        self._code.append(code)
+
+    def handle_old_comment(self, comment):
+        pass
+
+    def handle_new_comment(self, comment):
+        pass
+
+    def handle_end_of_line(self):
+        matches = re.match(r'\s*#include\s*(?P<token>["<])(?P<incl>[^">]+)[">]\s*$', ''.join(self._code))
+        if matches and not self._in_comment_at_start:
+            self.found.append((self._line_number, matches.group('incl'), matches.group('token') == '"'))
+
+
+def _contains(ids, num):
+    """ Return whether the sorted array ids contains num. """
+    position = bisect.bisect_left(ids, num)
+    return position < len(ids) and ids[position] == num
+
+
+class _Resolver(object):
+    """ Map includes to paths relative to root, by searching the including folder (relative includes only) and the
+        include folders. Returns the include itself for includes that can't be found.
+    """
+
+    def __init__(self, root, include_dirs=None):
+        self.root = root
+        self.include_dirs = [os.path.join(root, d) for d in (include_dirs or ['.'])]
+
+    def __call__(self, include, relative, folder):
+        for candidate_folder in ([folder] if relative else []) + self.include_dirs:
+            candidate = os.path.join(candidate_folder, include)
+            if os.path.isfile(candidate):
+                return os.path.relpath(candidate, self.root), os.path.getsize(candidate)
+        return include, 0
+
+
+class IncludeGraph(object):
+
+    def __init__(self, paths, translation_units, offsets, targets, sizes):
+        self.paths = paths  # id -> path (relative to root, or include name for external nodes)
+        self.ids = {path: num for num, path in enumerate(paths)}
+        self.translation_units = translation_units  # Sorted array of the ids of all translation units
+        self.offsets = offsets
+        self.targets = targets
+        self.sizes = sizes  # id -> size in bytes
+        self._closures = {}  # id -> sorted array of transitively included ids (shared within a cycle); on demand
+
+    def __len__(self):
+        return len(self.paths)
+
+    def includes(self, node):
+        """ Return the ids of all files directly included by node. """
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    @classmethod
+    def build(cls, root, include_dirs=None, include_sequence=None, include_apply=None):
+        """ Scan all C/C++ files below root and build the graph of their includes.
+
+        :param root: Root folder of the tree; node paths are relative to it.
+        :param include_dirs: Folders (relative to root) to search includes in; defaults to the root itself.
+        """
+        resolve = _Resolver(root, include_dirs)
+        ids = {}
+        sizes = []
+        edges = []
+
+        def intern(path, size):
+            if path not in ids:
+                ids[path] = len(ids)
+                sizes.append(size)
+                edges.append([])
+            return ids[path]
+
+        translation_units = []
+        for path, size in files.scan([root]):
+            node = intern(os.path.relpath(path, root), size)
+            if os.path.splitext(path)[1] in SOURCE_EXTENSIONS:
+                translation_units.append(node)
+            folder = os.path.dirname(path)
+            targets = set(intern(*resolve(include, relative, folder))
+                          for include, relative in collect_includes(path, root, include_sequence, include_apply))
+            edges[node] = sorted(targets - {node})
+
+        offsets = array.array('l', [0])
+        for targets in edges:
+            offsets.append(offsets[-1] + len(targets))
+        return cls(list(ids), array.array('l', sorted(translation_units)), offsets,
+                   array.array('l', [t for targets in edges for t in targets]), array.array('l', sizes))
+
+    def save(self, index_file):
+        with open(index_file, 'w') as out:
+            json.dump({'paths': self.paths, 'translation_units': self.translation_units.tolist(),
+                       'offsets': self.offsets.tolist(), 'targets': self.targets.tolist(),
+                       'sizes': self.sizes.tolist()}, out, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, index_file):
+        with open(index_file, 'r') as src:
+            data = json.load(src)
+        return cls(data['paths'], *[array.array('l', data[key])
+                                    for key in ('translation_units', 'offsets', 'targets', 'sizes')])
+
+    def _closure_ids(self, start):
+        """ Return the closure of start as sorted array, memoizing it along with the closures of all files it includes.
+
+            Closures are built bottom up along the strongly connected components (ie. include cycles) found by an
+            iterative version of Tarjan's algorithm, which doesn't descend into already known closures.
+        """
+        closures = self._closures
+        if start in closures:
+            return closures[start]
+        index, lowlink, on_stack = {}, {}, set()
+        stack = []
+        work = [(start, 0)]
+        while work:
+            node, edge = work.pop()
+            if edge == 0:
+                index[node] = lowlink[node] = len(index)
+                stack.append(node)
+                on_stack.add(node)
+            targets = self.includes(node)
+            while edge < len(targets):
+                target = targets[edge]
+                edge += 1
+                if target in closures:
+                    continue
+                elif target not in index:
+                    work.append((node, edge))
+                    work.append((target, 0))
+                    break
+                elif target in on_stack:
+                    lowlink[node] = min(lowlink[node], index[target])
+            else:
+                if lowlink[node] == index[node]:  # node is the root of a component, all included ones are known
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    ids = set(component) if len(component) > 1 else set()
+                    for member in component:
+                        for target in self.includes(member):
+                            if target in closures:
+                                ids.add(target)
+                                ids.update(closures[target])
+                    ids = array.array('l', sorted(ids))
+                    for member in component:
+                        closures[member] = ids
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+        return closures[start]
+
+    def closure(self, node):
+        """ Return the set of ids of all files transitively included by node.
+
+            Files included through a cycle (eg. node itself, if it's part of one) are contained.
+        """
+        return set(self._closure_ids(node))
+
+    def redundant_includes(self, node):
+        """ Return list of (redundant, via) for direct includes of node, that are pulled in through another one.
+
+            Includes with larger closures are kept first, so of two headers including each other only one is reported.
+        """
+        kept, redundant = [], []
+        closures = {target: self._closure_ids(target) for target in self.includes(node)}
+        for target in sorted(closures, key=lambda n: -len(closures[n])):
+            via = [k for k in kept if _contains(closures[k], target)]
+            if via:
+                redundant.append((target, via[0]))
+            else:
+                kept.append(target)
+        return sorted(redundant)
+
+    def most_included(self, num=None):
+        """ Return up to num (path, number of files including it directly) sorted by descending fan-in. """
+        fan_in = collections.Counter(self.targets)
+        return [(self.paths[node], count) for node, count in fan_in.most_common(num)]
+
+    def include_costs(self, num=None):
+        """ Return up to num (path, number of headers, bytes) of translation units, sorted by transitive include cost.
+
+            The cost of a translation unit is the total size of all headers it includes (transitively).
+        """
+        costs = []
+        totals = {}  # id of closure array -> total size of its headers, shared within a cycle
+        for node in self.translation_units:
+            closure = self._closure_ids(node)
+            if id(closure) not in totals:
+                totals[id(closure)] = sum(map(self.sizes.__getitem__, closure))
+            headers, size = len(closure), totals[id(closure)]
+            if _contains(closure, node):
+                headers, size = headers - 1, size - self.sizes[node]
+            costs.append((self.paths[node], headers, size))
+        return sorted(costs, key=lambda cost: (-cost[2], cost[0]))[:num]
+
+    def pch_candidates(self, min_share=0.5, num=None):
+        """ Return up to num precompiled header candidates as (path, number of translation units, size).
+
+            Candidates are headers (transitively) included by at least min_share of all translation units. They are
+            sorted by the total amount of bytes parsed because of them, ie. the product of both numbers.
+        """
+        reached = collections.Counter()
+        for node in self.translation_units:
+            closure = self._closure_ids(node)
+            reached.update(closure)
+            if _contains(closure, node):
+                reached.subtract([node])
+        threshold = min_share * len(self.translation_units)
+        candidates = [(self.paths[node], count, self.sizes[node]) for node, count in reached.items()
+                      if count and count >= threshold and self.sizes[node]]
+        return sorted(candidates, key=lambda c: (-c[1] * c[2], c[0]))[:num]
+
+
+def remove_redundant_includes(graph, root, path, include_dirs=None):
+    """ Rewrite file path (relative to root) without the lines of its redundant includes; nothing else is changed.
+
+    :return: List of removed includes (as written in the code).
+    """
+    resolve = _Resolver(root, include_dirs)
+    full_path = os.path.join(root, path)
+    folder = os.path.dirname(full_path)
+    redundant = set(target for target, _ in graph.redundant_includes(graph.ids[path]))
+    parser = _IncludeLines()
+    with open(full_path, 'r') as code:
+        for line in code:
+            parser.feed(line)
+    parser.finish()
+    remove = [(line_number, include) for line_number, include, relative in parser.found
+              if graph.ids.get(resolve(include, relative, folder)[0]) in redundant]
+    if remove:
+        remove_lines = set(line_number for line_number, _ in remove)
+        with open(full_path, 'r') as code, includes.atomic_open(full_path) as out:
+            for line_number, line in enumerate(code, 1):
+                if line_number not in remove_lines:
+                    out.write(line)
+    return sorted(set(include for _, include in remove))
+
+
+def _print_table(title, rows):
+    print(title)
+    for row in rows:
+        print('  ' + '\t'.join(str(column) for column in row))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and query the include graph of a C/C++ tree.')
+    commands = parser.add_subparsers(dest='command')
+    build = commands.add_parser('build', help='Scan a tree and save its include graph')
+    build.add_argument('root', help='Root folder of the tree')
+    build.add_argument('-I', dest='include_dirs', action='append', help='Include folder relative to root')
+    build.add_argument('--index', required=True, help='File to save the graph to')
+    report = commands.add_parser('report', help='Print reports about a saved include graph')
+    report.add_argument('--index', required=True, help='File the graph was saved to')
+    report.add_argument('--top', type=int, default=20, help='Number of entries per report')
+    report.add_argument('--min-share', type=float, default=0.5,
+                        help='Minimal share of translation units including a precompiled header candidate')
+    redundant = commands.add_parser('redundant', help='Report includes already pulled in by other includes')
+    redundant.add_argument('root', help='Root folder of the tree')
+    redundant.add_argument('-I', dest='include_dirs', action='append', help='Include folder relative to root')
+    redundant.add_argument('--index', help='Use this saved graph rather than scanning the tree')
+    redundant.add_argument('--remove', action='store_true', help='Remove the redundant includes')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        IncludeGraph.build(args.root, include_dirs=args.include_dirs).save(args.index)
+    elif args.command == 'report':
+        graph = IncludeGraph.load(args.index)
+        _print_table('Most included headers (path, fan-in):', graph.most_included(args.top))
+        _print_table('Transitive include cost per TU (path, headers, bytes):', graph.include_costs(args.top))
+        _print_table('Precompiled header candidates (path, TUs, bytes):',
+                     graph.pch_candidates(args.min_share, args.top))
+    elif args.command == 'redundant':
+        graph = IncludeGraph.load(args.index) if args.index else IncludeGraph.build(args.root, args.include_dirs)
+        for node in graph.translation_units:
+            for target, via in graph.redundant_includes(node):
+                print('%s: %s is included through %s' % (graph.paths[node], graph.paths[target], graph.paths[via]))
+            if args.remove and graph.redundant_includes(node):
+                remove_redundant_includes(graph, args.root, graph.paths[node], include_dirs=args.include_dirs)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
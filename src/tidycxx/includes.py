@@ -4,12 +4,55 @@ __version__ = '0.1'
 
 from . import comments
 
-import collections
-import logging
+# Keep imports minimal here: short-lived hook invocations mostly process files that are tidy already. Modules only
+# needed on rare paths (eg. subprocess, textwrap, logging) are imported where they're used.
+import io
 import os.path
 import re
-import subprocess
-import textwrap
+import sys
+
+
+def _log(level, message):
+    """ Log message via logging.<level>, importing logging only when it's actually needed.
+
+        Debug and info messages are dropped unless logging got imported (and thus possibly configured) elsewhere:
+        logging's default configuration would discard them anyway.
+    """
+    if level in ('debug', 'info') and 'logging' not in sys.modules:
+        return
+    import logging
+    getattr(logging, level)(message)
+
+
+class ChunkedWriter(object):
+    """ Text sink collecting written data and forwarding it to stream in chunks of (at least) chunk_size characters.
+
+        Keeps the number of write calls on the underlying stream low, while never holding more than roughly chunk_size
+        characters in memory.
+    """
+
+    def __init__(self, stream, chunk_size=1 << 16):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self._pending = []
+        self._pending_size = 0
+
+    def write(self, text):
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.stream.write(''.join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+
+class _ListWriter(object):
+    def __init__(self, parts):
+        self.write = parts.append
 
 
 def _split_groups(iterable, key=lambda x: x):
@@ -89,8 +132,10 @@ class IncludeSequencer(object):
     def __init__(self):
         self._roots = []
         self.invalid_id = str(IncludeTreeNode().invalid_id)
+        self._sort_keys = {}  # Include -> sort key (see sort_key)
 
     def add_root(self):
+        self._sort_keys.clear()
         self._roots.append(IncludeTreeNode(descendable=True))
         return self._roots[-1]
 
@@ -110,6 +155,59 @@ class IncludeSequencer(object):
         sid, num = self._find_include(include, respect_descendable=False)
         return self._combine_ids(sid, num)
 
+    def sort_key(self, include):
+        """ Return the key absolute includes are ordered by, ie. the sort id followed by the include itself.
+
+            Keys are cached per sequencer, as the same headers are included by many files. The cache is dropped by
+            add_root; nodes must not be inserted into existing roots once includes were ordered.
+        """
+        key = self._sort_keys.get(include)
+        if key is None:
+            key = self._sort_keys[include] = self.sort_id(include) + include
+        return key
+
+    def order_blocks(self, blocks):
+        """ Order the (distinct) includes of each block like IncludeArranger does for absolute includes.
+
+            Intended for bulk processing, where the same headers appear in many blocks resp. files: Every distinct
+            include is ranked once, so each block is ordered by integer ranks rather than by (long) sort key strings.
+
+        :param blocks: Iterable of iterables of include paths.
+        :return: List with the ordered includes of each block.
+        """
+        blocks = [set(block) for block in blocks]
+        ranks = {include: rank for rank, include in enumerate(sorted(set().union(*blocks), key=self.sort_key))}
+        return [sorted(block, key=ranks.__getitem__) for block in blocks]
+
+    @classmethod
+    def from_config(cls, roots):
+        """ Build a sequencer from its plain data description (eg. parsed from JSON).
+
+            The description is a list of roots, each given as list of children. Every child is either a plain name or a
+            dict with keys 'name', 'descendable' (optional, default False) and 'children' (optional list of children).
+            A root is always descendable.
+
+            Example: [[{"name": "componentA", "descendable": true, "children": ["subA0", "subA1"]}, "componentB"]]
+        """
+        def insert_children(node, children):
+            for child in children:
+                if isinstance(child, str):
+                    child = {'name': child}
+                inserted = node.insert(child['name'], descendable=child.get('descendable', False))
+                insert_children(inserted, child.get('children', []))
+
+        sequencer = cls()
+        for children in roots:
+            insert_children(sequencer.add_root(), children)
+        return sequencer
+
+    @classmethod
+    def from_file(cls, config_file):
+        """ Build a sequencer from a JSON file; see from_config for its format. """
+        import json
+        with open(config_file, 'r') as config:
+            return cls.from_config(json.load(config))
+
     def group_id(self, include):
         sid, num = self._find_include(include, respect_descendable=True)
         ivl = len(self.invalid_id)
@@ -127,26 +225,92 @@ class _IncludeBuffer:
         # True for relative include (smae folder)
         # False for system and absolute includes (includes relative to -I compile settings)
         self.relative = None
-        self.original = ''  # How the include line and its' description were formatted originally
+        self._original = []  # How the include line and its' description were formatted originally (list of parts)
+        self._last = ''  # Last non-empty part added to original
+        self._spilled = None  # Temporary files holding original and description, once spilled (see spill)
+        self._num_spilled_comments = 0
+        self.num_lines = 0
 
     def clear(self):
-        self.include = None
+        if self._spilled:
+            for spill_file in self._spilled:
+                spill_file.close()
+        self.__init__()
+
+    def spill(self):
+        """ Move original and comments to temporary files; everything added afterwards goes there as well. """
+        import tempfile
+        description = self.description()
+        self._spilled = (tempfile.TemporaryFile('w+'), tempfile.TemporaryFile('w+'))
+        self._spilled[0].writelines(self._original)
+        self._spilled[1].write(description)
+        self._num_spilled_comments = len(self.comments)
+        self._original = []
         self.comments = []
-        self.relative = None
-        self.original = ''
+
+    def _original_chunks(self):
+        if self._spilled:
+            self._spilled[0].seek(0)
+            yield from iter(lambda: self._spilled[0].read(1 << 16), '')
+        yield from self._original
+
+    @property
+    def original(self):
+        return ''.join(self._original_chunks())
+
+    def write_original(self, write):
+        for chunk in self._original_chunks():
+            write(chunk)
+
+    def preceding_newlines(self):
+        """ Return the newlines original starts with. """
+        num = 0
+        for chunk in self._original_chunks():
+            stripped = chunk.lstrip('\n')
+            num += len(chunk) - len(stripped)
+            if stripped:
+                break
+        return '\n' * num
+
+    def add_original(self, text):
+        if text:
+            self._last = text
+            if self._spilled:
+                self._spilled[0].seek(0, 2)
+                self._spilled[0].write(text)
+            else:
+                self._original.append(text)
+
+    def has_original(self):
+        return bool(self._last)
+
+    def ends_with_newline(self):
+        return self._last.endswith('\n')
 
     def description(self):
+        if self._spilled:
+            self._spilled[1].seek(0)
+            return self._spilled[1].read()
         return ' '.join(self.comments)
 
     def add_comment(self, old, text):
         assert isinstance(old, bool) and isinstance(text, str)
-        self.comments.append(text)
-        self.original += (('/*%s*/' if old else '//%s') % text)
+        if self._spilled:
+            self._spilled[1].seek(0, 2)
+            self._spilled[1].write(' ' + text if self._num_spilled_comments else text)
+            self._num_spilled_comments += 1
+        else:
+            self.comments.append(text)
+        self.add_original(('/*%s*/' if old else '//%s') % text)
 
 
 class IncludeArranger(comments.CommentParser):
 
-    def __init__(self, git_root, original_name, include_sequence=None, include_apply=None):
+    # Longer runs of comment lines (possibly describing the next include) are buffered in temporary files rather than
+    # in memory. This bounds the memory needed for huge comment blocks (eg. in amalgamated sources).
+    max_buffered_lines = 1000
+
+    def __init__(self, git_root, original_name, include_sequence=None, include_apply=None, output=None):
         """ Class for normalizing include structure for a single file of source code.
 
             TODO: Generalize git_root to project_root
@@ -155,6 +319,7 @@ class IncludeArranger(comments.CommentParser):
         :param original_name: Full path to input file (abs. or relative to git_root).
         :param include_sequence:
         :param include_apply: Callback invoked on each include discovered. TODO: Document interface.
+        :param output: Object with a write method receiving the arranged code (defaults to sys.stdout).
         """
         comments.CommentParser.__init__(self)
         self.git_root = git_root  # Root folder of the managing git repository
@@ -162,9 +327,10 @@ class IncludeArranger(comments.CommentParser):
         self.abs_includes = set()
         self.rel_includes = set()
         self.sys_includes = set()
-        self.icomments = collections.defaultdict(str)  # Mapping include files -> corr. comment_buffer in source code
+        self.icomments = {}  # Mapping include files -> corr. comment_buffer in source code
         self.mother = None  # The header corresponding to this source file (ie. C file)
         self.line_length = 120
+        self.output = output
 
         # Variables realted to parsing
         self._buffer = _IncludeBuffer()
@@ -188,9 +354,7 @@ class IncludeArranger(comments.CommentParser):
 
         if not self.num_cached_includes():
             # Directly print newlines here that precede a new block and otherwise would get lost
-            matches = re.match('^(?P<preceding>\n*)', self._buffer.original)  # TODO: Only in the beginning
-            if matches:
-                print(matches.group('preceding'), end='')
+            self._write(self._buffer.preceding_newlines())
 
         include = self._buffer.include
         if '/' in include:
@@ -204,7 +368,11 @@ class IncludeArranger(comments.CommentParser):
         # Save description, ie. comments, if non-trivial
         description = self._buffer.description()
         if description:
-            self.icomments[include] += ' ' + description
+            self.icomments[include] = self.icomments.get(include, '') + ' ' + description
+
+    def _write(self, text):
+        # Resolve sys.stdout lazily, so redirections after construction are respected
+        (self.output or sys.stdout).write(text)
 
     def _prepare_include(self, include, absolute=True):
         """ Applier called on each discovered include once.
@@ -220,7 +388,7 @@ class IncludeArranger(comments.CommentParser):
             self._buffer.include = matches.group('incl')
             self._buffer.relative = (matches.group('token') == '"')
         else:
-            self._buffer.original += code
+            self._buffer.add_original(code)
             if code.strip():
                 self._line_with_code = True
 
@@ -235,10 +403,13 @@ class IncludeArranger(comments.CommentParser):
             self._store_buffer()
             self._buffer.clear()
         else:
-            in_empty_line = self._buffer.original and self._buffer.original[-1] == '\n'
-            self._buffer.original += '\n'
+            in_empty_line = self._buffer.ends_with_newline()
+            self._buffer.add_original('\n')
+            self._buffer.num_lines += 1
             if in_empty_line or self._line_with_code:
                 self.empty_cache()
+            elif self._buffer.num_lines == self.max_buffered_lines:
+                self._buffer.spill()
         self._line_with_code = False
 
     def empty_cache(self):
@@ -246,11 +417,14 @@ class IncludeArranger(comments.CommentParser):
         self._print_cached()
         self._reset()
         # Print remaining buffered code with a newline
-        if self._buffer.original:
-            assert self._buffer.original[-1] == '\n'
-            print(self._buffer.original, end='')
+        if self._buffer.has_original():
+            assert self._buffer.ends_with_newline()
+            self._buffer.write_original(self._write)
         self._buffer.clear()
 
+    def finish(self):
+        self.empty_cache()
+
     def num_cached_includes(self):
         return len(self.abs_includes) + len(self.rel_includes) + len(self.sys_includes) + (1 if self.mother else 0)
 
@@ -260,13 +434,13 @@ class IncludeArranger(comments.CommentParser):
         for i in self.abs_includes:
             absolute, p = self._prepare_include(include=i, absolute=True)
             if not p:
-                logging.warning('Failed preparing %s. Removing it!' % i)
+                _log('warning', 'Failed preparing %s. Removing it!' % i)
             elif absolute:  # p is indeed an absolute include
                 verified_abs.append(p)
             else:  # p is in fact a relative include
                 verified_rel.append(p)
             if p:
-                self.icomments[p] = self.icomments[i]
+                self.icomments[p] = self.icomments.get(i, '')
 
         # Cope with relative includes
         # TODO: Do we really need this double copy pasta
@@ -275,26 +449,26 @@ class IncludeArranger(comments.CommentParser):
         for i in self.rel_includes:
             abs, p = self._prepare_include(include=i, absolute=False)
             if not p or os.path.split(p)[0]:  # TODO: Second condition ?
-                logging.warning('Failed to prepare %s. Removing it!' % i)
+                _log('warning', 'Failed to prepare %s. Removing it!' % i)
             elif not abs:
                 p = os.path.split(p)[1]
                 if mother_re.match(p):
                     self.mother = p
-                    logging.info('Found mother %s' % self.mother)
+                    _log('info', 'Found mother %s' % self.mother)
                 else:
                     verified_rel.append(p)
             elif abs:
                 verified_abs.append(p)
             if p:
-                self.icomments[p] = self.icomments[i]
+                self.icomments[p] = self.icomments.get(i, '')
 
-        self.abs_includes = sorted(set(verified_abs), key=lambda x: self._include_sequence.sort_id(x) + x)
+        self.abs_includes = sorted(set(verified_abs), key=self._include_sequence.sort_key)
         self.rel_includes = sorted(set(verified_rel))
         self.sys_includes = sorted(self.sys_includes)
 
     def _include_text(self, ifile, pre='<', post='>'):
         include_stub = '#include ' + pre + str(ifile) + post
-        comment = self.icomments[ifile].strip()
+        comment = self.icomments.get(ifile, '').strip()
 
         # Compress whitespace, remove newline chars
         comment_text = re.sub('[\n\t ]+', ' ', comment)
@@ -305,12 +479,13 @@ class IncludeArranger(comments.CommentParser):
             return oneliner + '\n'
         else:
             # Comment too long, split it apart
+            import textwrap
             lines = [('// %s' % line) for line in textwrap.wrap(comment_text, width=(self.line_length - len('// ')))]
             lines.append(include_stub)
             return '\n'.join(lines) + '\n'
 
     def _print_cached(self):
-        logging.debug('Printing cache...')
+        _log('debug', 'Printing cache...')
         self._prepare_includes()
         data_to_print = [
             ([i for i in [self.mother] if i], '"', '"'),
@@ -322,10 +497,10 @@ class IncludeArranger(comments.CommentParser):
         # Transform each group to '#include ...' strings using _include_text
         groups = [''.join(self._include_text(include, pre, post) for include in group) for group, pre, post in groups]
         # Print groups separated by single newline
-        print('\n'.join(groups), end='')
+        self._write('\n'.join(groups))
 
     def _reset(self):
-        logging.debug('Resetting cached data..')
+        _log('debug', 'Resetting cached data..')
         self.sys_includes = set()
         self.abs_includes = set()
         self.rel_includes = set()
@@ -333,12 +508,234 @@ class IncludeArranger(comments.CommentParser):
         self.icomments.clear()
 
 
-def arrange_includes(src_file, git_root=None):
+class Edit(object):
+    """ Replacement of the original lines start, ..., start + len(original) - 1 (counted from 1) by text. """
+
+    def __init__(self, start, original, text):
+        self.start = start
+        self.original = original  # List of original lines (including their newline characters, if any)
+        self.text = text
+
+    def __eq__(self, other):
+        return (self.start, self.original, self.text) == (other.start, other.original, other.text)
+
+    def __repr__(self):
+        return 'Edit(%d, %r, %r)' % (self.start, self.original, self.text)
+
+    def to_dict(self):
+        return {'start': self.start, 'end': self.start + len(self.original), 'text': self.text}
+
+
+class IncludeEditRecorder(IncludeArranger):
+    """ IncludeArranger recording edits (see attribute edits) instead of writing the complete arranged code.
+
+        Each time the arranger flushes its cache (see empty_cache), the code written since is compared with the lines
+        fed since (including their newline characters, so a missing newline at the end of the file is an edit, too).
+        Only if they differ, an Edit is recorded. Thus, memory and output size are proportional to the
+        changes (and the size of the largest include block) rather than to the size of the file.
+    """
+
+    def __init__(self, git_root, original_name, include_sequence=None, include_apply=None):
+        IncludeArranger.__init__(self, git_root, original_name, include_sequence=include_sequence,
+                                 include_apply=include_apply)
+        self.edits = []
+        self._segment_start = 1
+        self._segment_input = []
+        self._segment_output = []
+
+    def handle_input_line(self, input_line):
+        self._segment_input.append(input_line)
+
+    def _write(self, text):
+        self._segment_output.append(text)
+
+    def empty_cache(self):
+        IncludeArranger.empty_cache(self)
+        original, output = self._segment_input, ''.join(self._segment_output)
+        if output != ''.join(original):
+            self.edits.append(self._trimmed_edit(original, output))
+        self._segment_start += len(self._segment_input)
+        self._segment_input = []
+        self._segment_output = []
+
+    def _trimmed_edit(self, original, output):
+        # Restrict the edit to the lines that actually changed
+        lines = _split_lines(output)
+        head = 0
+        while head < min(len(original), len(lines)) and original[head] == lines[head]:
+            head += 1
+        tail = 0
+        while tail < min(len(original), len(lines)) - head and original[-1 - tail] == lines[-1 - tail]:
+            tail += 1
+        return Edit(self._segment_start + head, original[head:len(original) - tail],
+                    ''.join(lines[head:len(lines) - tail]))
+
+
+def _split_lines(text):
+    # Lines of text including their newline characters; unlike str.splitlines, only split at newline characters
+    return list(io.StringIO(text, newline='\n'))
+
+
+def _diff_lines(prefix, lines):
+    for line in lines:
+        yield prefix + line if line.endswith('\n') else prefix + line + '\n\\ No newline at end of file\n'
+
+
+def unified_diff(lines, edits, name, context=3):
+    """ Format edits of lines (list of original lines of file name, including newlines) as unified diff, showing up to
+        context unchanged lines around each change.
+    """
+    result = ['--- a/%s\n' % name, '+++ b/%s\n' % name] if edits else []
+    offset = 0  # Number of lines added (minus removed) before the current hunk
+    hunk = []
+    for num, edit in enumerate(edits):
+        hunk.append(edit)
+        following = edits[num + 1] if num + 1 < len(edits) else None
+        end = edit.start + len(edit.original)
+        if following and following.start - end <= 2 * context:
+            continue  # Context of both edits overlaps (or touches), ie. they share a hunk
+        begin, end = max(1, hunk[0].start - context), min(len(lines) + 1, end + context)
+        body, position, num_new = [], begin, end - begin
+        for hunk_edit in hunk:
+            new_lines = _split_lines(hunk_edit.text)
+            body.extend(_diff_lines(' ', lines[position - 1:hunk_edit.start - 1]))
+            body.extend(_diff_lines('-', hunk_edit.original))
+            body.extend(_diff_lines('+', new_lines))
+            position = hunk_edit.start + len(hunk_edit.original)
+            num_new += len(new_lines) - len(hunk_edit.original)
+        body.extend(_diff_lines(' ', lines[position - 1:end - 1]))
+        num_old = end - begin
+        result.append('@@ -%d,%d +%d,%d @@\n' % (begin if num_old else begin - 1, num_old,
+                                                (begin + offset) if num_new else begin + offset - 1, num_new))
+        result.extend(body)
+        offset += num_new - num_old
+        hunk = []
+    return ''.join(result)
+
+
+def apply_edits(lines, edits):
+    """ Return the code resulting from applying edits to lines (list of original lines including newlines). """
+    result = []
+    position = 1
+    for edit in edits:
+        result.extend(lines[position - 1:edit.start - 1])
+        result.append(edit.text)
+        position = edit.start + len(edit.original)
+    result.extend(lines[position - 1:])
+    return ''.join(result)
+
+
+def find_git_root():
+    import subprocess
+    return subprocess.check_output('git rev-parse --show-toplevel'.split()).strip()
+
+
+class atomic_open(object):
+    """ Context manager opening a temporary file (for writing text) that replaces path once the context is left.
+
+        If the context is left by an exception, the temporary file is removed and path stays untouched. Thus (even if
+        interrupted) either the complete new content or nothing is written. Symbolic links are resolved, ie. the file
+        they point to is replaced. Files with several hard links can't be replaced without detaching path from the
+        other links, so OSError is raised for them and they stay untouched.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._real_path = None
+        self._temp_path = None
+        self._file = None
+
+    def __enter__(self):
+        import tempfile
+        self._real_path = os.path.realpath(self.path)
+        self._check_links()
+        folder, name = os.path.split(self._real_path)
+        handle, self._temp_path = tempfile.mkstemp(prefix='.' + name + '.', suffix='.tmp', dir=folder)
+        self._file = os.fdopen(handle, 'w')
+        return self._file
+
+    def _check_links(self):
+        """ Return the stat result of the file to replace (None if missing), raise OSError if it has hard links. """
+        try:
+            info = os.stat(self._real_path)
+        except FileNotFoundError:
+            return None
+        if info.st_nlink > 1:
+            import errno
+            raise OSError(errno.EMLINK, 'Refusing to replace a file with several hard links', self.path)
+        return info
+
+    def _replace(self):
+        info = self._check_links()  # Again, links might have been added meanwhile
+        if info is not None:
+            os.chmod(self._temp_path, info.st_mode & 0o7777)
+        os.replace(self._temp_path, self._real_path)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._file.close()
+            if exc_type is None:
+                self._replace()
+        except BaseException:
+            if os.path.exists(self._temp_path):
+                os.unlink(self._temp_path)
+            raise
+        if exc_type is not None:
+            os.unlink(self._temp_path)
+        return False
+
+
+def write_atomic(path, text):
+    """ Replace the content of file path by text, such that (even if interrupted) either all or nothing is written. """
+    with atomic_open(path) as out:
+        out.write(text)
+
+
+def arrange_code(code, original_name, git_root, include_sequence=None, include_apply=None):
+    """ Arrange the includes of code, ie. the full content of file original_name, and return the result as string.
+
+        Code is split into lines exactly like a file opened in text mode (ie. only at line breaks, not at form feeds
+        etc. like str.splitlines does).
+    """
+    result = []
+    arranger = IncludeArranger(git_root, original_name, include_sequence=include_sequence,
+                               include_apply=include_apply, output=_ListWriter(result))
+    for line in io.StringIO(code, newline=None):
+        arranger.feed(line)
+    arranger.empty_cache()
+    return ''.join(result)
+
+
+def arrange_edits(lines, original_name, git_root, include_sequence=None, include_apply=None):
+    """ Return the list of edits arranging the includes of lines (eg. an open file of name original_name), given
+        including their newline characters.
+    """
+    recorder = IncludeEditRecorder(git_root, original_name, include_sequence=include_sequence,
+                                   include_apply=include_apply)
+    for line in lines:
+        recorder.feed(line)
+    recorder.finish()
+    return recorder.edits
+
+
+def arrange_includes(src_file, git_root=None, output=None, chunk_size=1 << 16):
+    """ Arrange the includes of src_file and write the result to output (defaults to sys.stdout).
+
+        The file is streamed line by line and the result is written in chunks of about chunk_size characters, so memory
+        consumption doesn't depend on the size of the file, only on the size of its largest include block and its
+        largest /* ... */ comment (longer runs of comment lines are spilled to temporary files, see
+        IncludeArranger.max_buffered_lines).
+    """
     if not git_root:
-        git_root = subprocess.check_output('git rev-parse --show-toplevel'.split()).strip()
-    arranger = IncludeArranger(git_root, src_file)
+        git_root = find_git_root()
+    writer = ChunkedWriter(output or sys.stdout, chunk_size=chunk_size)
+    arranger = IncludeArranger(git_root, src_file, output=writer)
     # with fileinput.FileInput(sys.argv[1:], inplace=True, backup='.nwb')
     with open(src_file, 'r') as code:
-        for line in code.readlines():
+        for line in code:
             arranger.feed(line)
     arranger.empty_cache()
+    writer.flush()
@@ -0,0 +1,228 @@
+""" Tokenize a file once and run several passes (ie. CommentParser subclasses) over the resulting token stream.
+
+    Every pass sees exactly the calls to handle_input_line, handle_code, handle_old_comment, handle_new_comment and
+    handle_end_of_line it would see when being fed the file line by line, followed by a call to finish. All passes are
+    served within a single traversal of the token stream. Huge files may be tokenized in parallel chunks (see
+    tokenize_chunked).
+
+    Passes of a Pipeline are either rewriters or checkers. Rewriters (eg. IncludeEditRecorder) report their changes as
+    list of includes.Edit in their edits attribute; the edits of all rewriters are applied together, so any number of
+    rewriters share one read, one tokenization and one write of the file. Checkers report their results as list of
+    strings in their findings attribute.
+"""
+
+import io
+
+from . import comments
+from . import includes
+
+CODE, OLD_COMMENT, NEW_COMMENT, END_OF_LINE, INPUT_LINE = range(5)
+
+
+class TokenStream(object):
+    """ Compact representation of a tokenized file: token kinds are stored as bytes, texts in a parallel list. """
+
+    def __init__(self):
+        self.kinds = bytearray()
+        self.texts = []
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def append(self, kind, text=None):
+        self.kinds.append(kind)
+        self.texts.append(text)
+
+    def replay(self, *parsers):
+        """ Call the handlers of all parsers on each token, followed by a final call to finish. """
+        handlers = [(p.handle_code, p.handle_old_comment, p.handle_new_comment, None, p.handle_input_line)
+                    for p in parsers]
+        eol_handlers = [p.handle_end_of_line for p in parsers]
+        for kind, text in zip(self.kinds, self.texts):
+            if kind == END_OF_LINE:
+                for handler in eol_handlers:
+                    handler()
+            else:
+                for handler in handlers:
+                    handler[kind](text)
+        for parser in parsers:
+            parser.finish()
+
+
+class Tokenizer(comments.CommentParser):
+    """ Parser recording everything it's fed in a TokenStream (see attribute tokens). """
+
+    def __init__(self):
+        comments.CommentParser.__init__(self)
+        self.tokens = TokenStream()
+
+    def handle_input_line(self, input_line):
+        self.tokens.append(INPUT_LINE, input_line)
+
+    def handle_code(self, code):
+        self.tokens.append(CODE, code)
+
+    def handle_old_comment(self, comment):
+        self.tokens.append(OLD_COMMENT, comment)
+
+    def handle_new_comment(self, comment):
+        self.tokens.append(NEW_COMMENT, comment)
+
+    def handle_end_of_line(self):
+        self.tokens.append(END_OF_LINE)
+
+
+def tokenize(lines):
+    tokenizer = Tokenizer()
+    for line in lines:
+        tokenizer.feed(line)
+    return tokenizer.tokens
+
+
+def _tokenize_chunk(lines):
+    """ Tokenize lines speculatively, for starting outside and inside of a /* ... */ comment.
+
+    :return: For either starting state a tuple of the tokens' kinds, their texts, whether the chunk ends inside of a
+             comment and the comment text buffered at its end.
+    """
+    results = []
+    for in_old_comment in (False, True):
+        tokenizer = Tokenizer()
+        tokenizer.in_old_comment = in_old_comment
+        for line in lines:
+            tokenizer.feed(line)
+        results.append((bytes(tokenizer.tokens.kinds), tokenizer.tokens.texts, tokenizer.in_old_comment,
+                        ''.join(tokenizer.old_comment_buffer)))
+    return results
+
+
+def tokenize_chunked(lines, chunk_lines=50000, executor=None):
+    """ Tokenize lines like tokenize, but split into chunks of chunk_lines lines which are tokenized in parallel.
+
+        Since it's unknown whether a chunk starts inside of a comment before its predecessors are tokenized, each chunk
+        is tokenized for both cases. The results are stitched together in order, picking the variant matching the state
+        at the end of the previous chunk. A comment spanning chunks is reassembled from the text buffered at the end of
+        the previous chunk(s) and the first token (besides input lines) of the chunk closing it.
+
+    :param executor: Executor tokenizing the chunks (defaults to a process pool).
+    """
+    lines = list(lines)
+    chunks = [lines[start:start + chunk_lines] for start in range(0, len(lines), chunk_lines)]
+    own_executor = executor is None
+    if own_executor:
+        import concurrent.futures
+        executor = concurrent.futures.ProcessPoolExecutor()
+    try:
+        results = executor.map(_tokenize_chunk, chunks)
+        tokens = TokenStream()
+        in_old_comment, pending = False, ''
+        for speculative in results:
+            kinds, texts, ends_in_comment, buffered = speculative[in_old_comment]
+            if in_old_comment and pending:
+                first = next((num for num, kind in enumerate(kinds) if kind != INPUT_LINE), None)
+                if first is not None:  # The chunk closes the pending comment with this token
+                    texts = texts[:first] + [pending + texts[first]] + texts[first + 1:]
+                else:
+                    buffered = pending + buffered
+            tokens.kinds.extend(kinds)
+            tokens.texts.extend(texts)
+            in_old_comment, pending = ends_in_comment, buffered
+        return tokens
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def _overlap(edit, other):
+    # Edits touching the same lines (or inserting at the same line) can't be applied together
+    end, other_end = edit.start + len(edit.original), other.start + len(other.original)
+    return edit.start == other.start or (edit.start < other_end and other.start < end)
+
+
+class Pipeline(object):
+
+    def __init__(self, chunk_lines=None, executor=None):
+        """ Pipeline of passes run over each file.
+
+        :param chunk_lines: Tokenize files with more lines in parallel chunks of this size (see tokenize_chunked).
+        :param executor: Executor for tokenizing chunks (see tokenize_chunked).
+        """
+        self.rewriters = []
+        self.checkers = []
+        self.chunk_lines = chunk_lines
+        self.executor = executor
+
+    def add_rewriter(self, rewriter):
+        """ Add a pass changing the file to the pipeline.
+
+        :param rewriter: Callable (original_name) -> CommentParser with an edits attribute, ie. sorted list of
+                         non-overlapping includes.Edit of the lines it was fed.
+        """
+        self.rewriters.append(rewriter)
+        return rewriter
+
+    def add_checker(self, checker):
+        """ Add another checking pass to the pipeline.
+
+        :param checker: Callable (original_name) -> CommentParser with a findings attribute.
+        """
+        self.checkers.append(checker)
+        return checker
+
+    def _tokenize(self, lines):
+        if self.chunk_lines and len(lines) > self.chunk_lines:
+            return tokenize_chunked(lines, chunk_lines=self.chunk_lines, executor=self.executor)
+        return tokenize(lines)
+
+    def run(self, code, original_name):
+        """ Run all passes over code, ie. the content of file original_name.
+
+            The edits of all rewriters are applied at once. Usually, rewriters change different parts of a file. Only
+            if the edits of a rewriter overlap those of rewriters added before it, it's run again on the code those
+            produced (and so on).
+
+        :return: Tuple of rewritten code and list of findings (by all checkers, on the original code).
+        """
+        findings = []
+        rewriters, checkers = self.rewriters, self.checkers
+        while True:
+            lines = list(io.StringIO(code, newline=None))  # Split like reading a file, ie. only at line breaks
+            rewriting = [rewriter(original_name) for rewriter in rewriters]
+            checking = [checker(original_name) for checker in checkers]
+            self._tokenize(lines).replay(*(rewriting + checking))
+            findings.extend(finding for checker in checking for finding in checker.findings)
+
+            edits, deferred = [], []
+            for rewriter, rewriting_pass in zip(rewriters, rewriting):
+                if any(_overlap(edit, other) for edit in rewriting_pass.edits for other in edits):
+                    deferred.append(rewriter)
+                else:
+                    edits.extend(rewriting_pass.edits)
+            code = includes.apply_edits(lines, sorted(edits, key=lambda edit: edit.start))
+            if not deferred:
+                return code, findings
+            rewriters, checkers = deferred, []
+
+    def run_file(self, path, in_place=False):
+        """ Run all passes over file path, reading it once and writing it (at most) once.
+
+        :return: Tuple of whether the file changed and list of findings.
+        """
+        with open(path, 'r') as src:
+            code = src.read()
+        result, findings = self.run(code, path)
+        changed = (result != code)
+        if changed and in_place:
+            includes.write_atomic(path, result)
+        return changed, findings
+
+
+def include_pipeline(git_root, include_sequence=None, include_apply=None, **kwargs):
+    """ Create a Pipeline with an include arranging rewriter; kwargs are passed to Pipeline. """
+    pipeline = Pipeline(**kwargs)
+
+    @pipeline.add_rewriter
+    def arranger(original_name):
+        return includes.IncludeEditRecorder(git_root, original_name, include_sequence=include_sequence,
+                                            include_apply=include_apply)
+    return pipeline
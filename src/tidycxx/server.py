@@ -0,0 +1,127 @@
+""" Long-running server arranging includes of buffers sent by editors or pre-commit hooks.
+
+    The protocol is line based: every request is a single line of JSON, answered by a single line of JSON.
+
+        request:  {"id": 1, "path": "prjA/mom.C", "code": "#include <b>\\n#include <a>\\n"}
+        response: {"id": 1, "code": "#include <a>\\n#include <b>\\n", "changed": true}
+
+    On failure, the response contains an "error" message instead of "code" and "changed". The server keeps the include
+    ordering (read from a JSON config, see IncludeSequencer.from_config) in memory and only reloads it once the config
+    file changes. Requests are read from stdin (answers written to stdout) or from clients of a unix domain socket.
+"""
+
+import argparse
+import errno
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+
+from . import includes
+
+
+class TidyServer(object):
+
+    def __init__(self, config=None, git_root=None):
+        """ Handler of tidy requests.
+
+        :param config: Path to JSON config describing the include ordering (default ordering if omitted).
+        :param git_root: See IncludeArranger.
+        """
+        self.config = config
+        self.git_root = git_root
+        self._config_stamp = None
+        self._sequencer = None
+
+    def sequencer(self):
+        """ Return the include sequencer, (re-)built only if the config file changed since the last call. """
+        stamp = None
+        if self.config:
+            info = os.stat(self.config)
+            stamp = (info.st_mtime_ns, info.st_size)
+        if self._sequencer is None or stamp != self._config_stamp:
+            if self.config:
+                self._sequencer = includes.IncludeSequencer.from_file(self.config)
+            else:
+                self._sequencer = includes.IncludeSequencer()
+            self._config_stamp = stamp
+        return self._sequencer
+
+    def handle(self, request):
+        """ Answer request (a dict decoded from the JSON protocol) and return the response as dict. """
+        response = {'id': request.get('id')}
+        try:
+            code = request['code']
+            result = includes.arrange_code(code, request.get('path', ''), self.git_root or '',
+                                           include_sequence=self.sequencer())
+            response.update(code=result, changed=(result != code))
+        except Exception as e:
+            response['error'] = '%s: %s' % (type(e).__name__, e)
+        return response
+
+    def handle_line(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return json.dumps({'id': None, 'error': 'Invalid request: %s' % e})
+        if not isinstance(request, dict):
+            return json.dumps({'id': None, 'error': 'Invalid request: expected a JSON object'})
+        return json.dumps(self.handle(request))
+
+
+def serve_stream(server, instream, outstream):
+    """ Answer requests read line by line from instream until it is exhausted. """
+    for line in instream:
+        if line.strip():
+            outstream.write(server.handle_line(line) + '\n')
+            outstream.flush()
+
+
+def serve_socket(server, socket_path):
+    """ Answer requests of clients connecting to the unix domain socket socket_path (runs until interrupted). """
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if line.strip():
+                    self.wfile.write((server.handle_line(line.decode('utf8')) + '\n').encode('utf8'))
+
+    try:
+        info = os.stat(socket_path)
+    except FileNotFoundError:
+        pass
+    else:  # Remove the stale socket of a previous run, but nothing else
+        if not stat.S_ISSOCK(info.st_mode):
+            raise FileExistsError(errno.EEXIST, 'Refusing to replace a file that is not a socket', socket_path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(socket_path)
+            except ConnectionRefusedError:
+                os.unlink(socket_path)
+            else:
+                raise FileExistsError(errno.EEXIST, 'Another server is listening on the socket', socket_path)
+    with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as socket_server:
+        socket_server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve include arranging requests (one JSON object per line).')
+    parser.add_argument('--config', help='JSON file describing the include ordering')
+    parser.add_argument('--git-root', help='Root folder of the project')
+    parser.add_argument('--socket', help='Listen on this unix domain socket instead of stdin')
+    args = parser.parse_args(argv)
+
+    server = TidyServer(config=args.config, git_root=args.git_root)
+    server.sequencer()  # Fail early on invalid configs
+    try:
+        if args.socket:
+            serve_socket(server, args.socket)
+        else:
+            serve_stream(server, sys.stdin, sys.stdout)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
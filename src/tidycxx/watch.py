@@ -0,0 +1,128 @@
+""" Watch mode: keep the includes of a tree arranged while its files are edited.
+
+    The tree is indexed once (modification time and size of every file). Afterwards the index is polled cheaply via
+    directory scans, bursts of saves are debounced and only files that changed are arranged again, reusing one warm
+    IncludeTool (and thus include sequencer) for all of them.
+
+    Usage:
+        python -m tidycxx.watch [--interval SECONDS] [--debounce SECONDS] PATH...
+"""
+
+import argparse
+import os
+import time
+
+from . import batch
+from . import files
+from . import includes
+
+
+def _stamp(info):
+    return info.st_mtime_ns, info.st_size
+
+
+def _unchanged(path, stamp):
+    try:
+        return _stamp(os.stat(path)) == stamp
+    except FileNotFoundError:
+        return False
+
+
+class MtimeIndex(object):
+    """ Index of the modification time and size of all C/C++ files below some paths. """
+
+    def __init__(self, paths, extensions=files.SOURCE_EXTENSIONS + files.HEADER_EXTENSIONS):
+        self.paths = paths
+        self.extensions = extensions
+        self.entries = dict(self._scan())  # path -> (mtime_ns, size)
+
+    def _scan(self):
+        for path, info in files.walk(self.paths, self.extensions, missing_ok=True):
+            yield path, _stamp(info)
+
+    def update(self, path):
+        """ Record the current state of path (eg. after modifying it deliberately). """
+        self.entries[path] = _stamp(os.stat(path))
+
+    def changes(self):
+        """ Rescan all paths and return the sorted list of files that are new or changed since the last call. """
+        entries = dict(self._scan())
+        changed = sorted(path for path, stamp in entries.items() if self.entries.get(path) != stamp)
+        self.entries = entries
+        return changed
+
+
+class Watcher(object):
+
+    def __init__(self, paths, tool, debounce=0.3):
+        """ Arrange changed files below paths using tool (eg. batch.IncludeTool).
+
+        :param debounce: Seconds without further changes, before changed files are processed.
+        """
+        self.index = MtimeIndex(paths)
+        self.tool = tool
+        self.debounce = debounce
+        self._pending = set()
+        self._last_change = None
+
+    def poll(self, now=None):
+        """ Check for changes once; return mapping path -> status of files processed within this call.
+
+            Files saved again while being processed are left untouched and processed again once they settled.
+        """
+        now = time.time() if now is None else now
+        changed = self.index.changes()
+        if changed:
+            self._pending.update(changed)
+            self._last_change = now
+        if not self._pending or now - self._last_change < self.debounce:
+            return {}
+
+        pending, self._pending = sorted(self._pending), set()
+        statuses = {}
+        for path in pending:
+            try:
+                stamp = _stamp(os.stat(path))
+            except FileNotFoundError:
+                continue
+            try:
+                status = self.tool(path, True, unchanged=lambda: _unchanged(path, stamp))
+            except Exception as e:
+                status = batch.error_status(e)
+            if status == batch.STALE:
+                self._pending.add(path)
+                self._last_change = now
+                continue
+            statuses[path] = status
+            if status == batch.FIXED:
+                self.index.update(path)  # Don't process our own modification again
+        return statuses
+
+    def run(self, interval=0.5, report=print):
+        """ Poll every interval seconds until interrupted, reporting processed files that aren't tidy. """
+        while True:
+            for path, status in sorted(self.poll().items()):
+                if status != batch.TIDY:
+                    report('%s: %s' % (path, status))
+            time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Keep the includes of C/C++ files arranged while they are edited.')
+    parser.add_argument('paths', nargs='+', help='Files or folders to watch')
+    parser.add_argument('--interval', type=float, default=0.5, help='Seconds between polls')
+    parser.add_argument('--debounce', type=float, default=0.3, help='Seconds to wait for further changes')
+    parser.add_argument('--config', help='JSON file describing the include ordering')
+    parser.add_argument('--git-root', help='Root folder of the project')
+    args = parser.parse_args(argv)
+
+    sequencer = includes.IncludeSequencer.from_file(args.config) if args.config else None
+    tool = batch.IncludeTool(args.git_root or includes.find_git_root(), include_sequence=sequencer)
+    try:
+        Watcher(args.paths, tool, debounce=args.debounce).run(interval=args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,451 @@
+""" Helpers for differential testing: reference implementations, random input generators and a test case shrinker.
+
+    The reference implementations below are frozen copies of the original (unoptimized) code. Optimized code paths
+    must produce exactly the same results as them on any input.
+"""
+
+import collections
+import contextlib
+import io
+import logging
+import os.path
+import random
+import re
+import textwrap
+
+from tidycxx.includes import IncludeSequencer, IncludeTreeNode
+
+
+class ReferenceCommentParser(object):
+    """ Original CommentParser. """
+
+    def __init__(self):
+        self.in_old_comment = False
+        self.old_comment_buffer = ''
+
+    def _handle_code(self, code):
+        if code:  # if there is no code to handle, don't handle it!
+            self.handle_code(code)
+
+    def feed(self, input_line):
+        input_line = input_line.strip('\n')
+        while True:
+            matches = re.match(r'(?P<text>.*?)(?P<delimiter>' + (r'\*/' if self.in_old_comment else r'//|/\*')
+                               + r')(?P<else>.*)', input_line)
+            if not matches:
+                break
+
+            input_line = matches.group('else')
+            if self.in_old_comment:
+                self.handle_old_comment(self.old_comment_buffer + matches.group('text'))
+                self.old_comment_buffer = ''
+                self.in_old_comment = False
+            else:
+                self._handle_code(matches.group('text'))
+                if matches.group('delimiter') == '/*':
+                    self.in_old_comment = True
+                else:
+                    self.handle_new_comment(input_line)  # Input line contains else matching group; see above
+                    self.handle_end_of_line()
+                    return  # this line needs no further analysis
+
+        # Handle stuff at end of line, ie. block not delimited by (eg. '*/') in this line
+        if self.in_old_comment:
+            self.old_comment_buffer += input_line + '\n'
+        else:
+            self._handle_code(input_line)
+            self.handle_end_of_line()
+
+
+class _CallRecorder(ReferenceCommentParser):
+    """ ReferenceCommentParser recording the handler calls as list of (handler, argument). """
+
+    def __init__(self):
+        ReferenceCommentParser.__init__(self)
+        self.calls = []
+
+    def handle_code(self, code):
+        self.calls.append(('code', code))
+
+    def handle_old_comment(self, comment):
+        self.calls.append(('old', comment))
+
+    def handle_new_comment(self, comment):
+        self.calls.append(('new', comment))
+
+    def handle_end_of_line(self):
+        self.calls.append(('eol', None))
+
+
+def reference_calls(lines):
+    parser = _CallRecorder()
+    for line in lines:
+        parser.feed(line)
+    return parser.calls
+
+
+def _reference_node_id(node, item, group_only):
+    # Original IncludeTreeNode.id
+    if not item or (group_only and not node.descendable):
+        return ''
+    parts = item.split(node.delimiter)
+    try:
+        idx = node.children.index(parts[0])
+        return ('{:0' + str(len(str(node.invalid_id))) + 'd}{:s}').format(
+            idx, _reference_node_id(node.children[idx], node.delimiter.join(parts[1:]), group_only))
+    except ValueError:
+        return str(node.invalid_id)
+
+
+def reference_sort_id(sequencer, include):
+    """ Original IncludeSequencer.sort_id. """
+    invalid_id = str(IncludeTreeNode.invalid_id)
+    for num, root in enumerate(sequencer._roots):
+        sid = _reference_node_id(root, include, False)
+        if sid != invalid_id:
+            break
+    else:
+        sid, num = invalid_id, int(invalid_id)
+    return ('{:0' + str(len(invalid_id)) + 'd}{:s}').format(num, sid)
+
+
+def reference_group_id(sequencer, include):
+    """ Original IncludeSequencer.group_id. """
+    invalid_id = str(IncludeTreeNode.invalid_id)
+    for root in sequencer._roots:
+        sid = _reference_node_id(root, include, True)
+        if sid != invalid_id:
+            return sid
+    return invalid_id
+
+
+class _ReferenceSequencer(object):
+    def __init__(self, sequencer):
+        self.sequencer = sequencer
+
+    def sort_id(self, include):
+        return reference_sort_id(self.sequencer, include)
+
+    def group_id(self, include):
+        return reference_group_id(self.sequencer, include)
+
+
+def _reference_split_groups(iterable, key=lambda x: x):
+    # Original _split_groups
+    result = []
+    last_key = None
+    for element in iterable:
+        cur_key = key(element)
+        if last_key == cur_key:
+            result[-1].append(element)
+        else:
+            result.append([element])
+            last_key = cur_key
+    return result
+
+
+class _ReferenceIncludeBuffer:
+    """ Original _IncludeBuffer. """
+
+    def __init__(self):
+        self.include = None
+        self.comments = []
+        self.relative = None
+        self.original = ''
+
+    def clear(self):
+        self.include = None
+        self.comments = []
+        self.relative = None
+        self.original = ''
+
+    def description(self):
+        return ' '.join(self.comments)
+
+    def add_comment(self, old, text):
+        assert isinstance(old, bool) and isinstance(text, str)
+        self.comments.append(text)
+        self.original += (('/*%s*/' if old else '//%s') % text)
+
+
+class ReferenceIncludeArranger(ReferenceCommentParser):
+    """ Original IncludeArranger, printing the arranged code. """
+
+    def __init__(self, git_root, original_name, include_sequence=None, include_apply=None):
+        ReferenceCommentParser.__init__(self)
+        self.git_root = git_root
+        self.original_name = original_name
+        self.abs_includes = set()
+        self.rel_includes = set()
+        self.sys_includes = set()
+        self.icomments = collections.defaultdict(str)
+        self.mother = None
+        self.line_length = 120
+
+        self._buffer = _ReferenceIncludeBuffer()
+        self._line_with_code = False
+
+        if not include_sequence:
+            include_sequence = IncludeSequencer()
+        self._include_sequence = _ReferenceSequencer(include_sequence)
+
+        if not include_apply:
+            def include_apply(include, absolute=True):
+                return absolute, include
+        self._include_apply = include_apply
+
+    def _store_buffer(self):
+        assert self._buffer.include  # Otherwise no include statement got buffered
+
+        if not self.num_cached_includes():
+            # Directly print newlines here that precede a new block and otherwise would get lost
+            matches = re.match('^(?P<preceding>\n*)', self._buffer.original)
+            if matches:
+                print(matches.group('preceding'), end='')
+
+        include = self._buffer.include
+        if '/' in include:
+            dest = self.abs_includes
+        elif self._buffer.relative:
+            dest = self.rel_includes
+        else:
+            dest = self.sys_includes
+        dest.add(include)
+
+        description = self._buffer.description()
+        if description:
+            self.icomments[include] += ' ' + description
+
+    def _prepare_include(self, include, absolute=True):
+        assert isinstance(absolute, bool)
+        return self._include_apply(include=include, absolute=absolute)
+
+    def handle_code(self, code):
+        matches = re.match(r'\s*#include\s*(?P<token>["<])(?P<incl>[^">]+)[">]\s*$', code)
+        if matches:
+            self._buffer.include = matches.group('incl')
+            self._buffer.relative = (matches.group('token') == '"')
+        else:
+            self._buffer.original += code
+            if code.strip():
+                self._line_with_code = True
+
+    def handle_old_comment(self, comment):
+        self._buffer.add_comment(True, comment)
+
+    def handle_new_comment(self, comment):
+        self._buffer.add_comment(False, comment)
+
+    def handle_end_of_line(self):
+        if self._buffer.include:
+            self._store_buffer()
+            self._buffer.clear()
+        else:
+            in_empty_line = self._buffer.original and self._buffer.original[-1] == '\n'
+            self._buffer.original += '\n'
+            if in_empty_line or self._line_with_code:
+                self.empty_cache()
+        self._line_with_code = False
+
+    def empty_cache(self):
+        self._print_cached()
+        self._reset()
+        if self._buffer.original:
+            assert self._buffer.original[-1] == '\n'
+            print(self._buffer.original, end='')
+        self._buffer.clear()
+
+    def num_cached_includes(self):
+        return len(self.abs_includes) + len(self.rel_includes) + len(self.sys_includes) + (1 if self.mother else 0)
+
+    def _prepare_includes(self):
+        verified_abs, verified_rel = [], []
+        for i in self.abs_includes:
+            absolute, p = self._prepare_include(include=i, absolute=True)
+            if not p:
+                logging.warning('Failed preparing %s. Removing it!' % i)
+            elif absolute:
+                verified_abs.append(p)
+            else:
+                verified_rel.append(p)
+            if p:
+                self.icomments[p] = self.icomments[i]
+
+        original_path, original_name = os.path.split(self.original_name)
+        mother_re = re.compile('^' + original_name.split('.', 1)[0] + r'\.[Hh]$')
+        for i in self.rel_includes:
+            abs, p = self._prepare_include(include=i, absolute=False)
+            if not p or os.path.split(p)[0]:
+                logging.warning('Failed to prepare %s. Removing it!' % i)
+            elif not abs:
+                p = os.path.split(p)[1]
+                if mother_re.match(p):
+                    self.mother = p
+                    logging.info('Found mother %s' % self.mother)
+                else:
+                    verified_rel.append(p)
+            elif abs:
+                verified_abs.append(p)
+            if p:
+                self.icomments[p] = self.icomments[i]
+
+        self.abs_includes = sorted(set(verified_abs), key=lambda x: self._include_sequence.sort_id(x) + x)
+        self.rel_includes = sorted(set(verified_rel))
+        self.sys_includes = sorted(self.sys_includes)
+
+    def _include_text(self, ifile, pre='<', post='>'):
+        include_stub = '#include ' + pre + str(ifile) + post
+        comment = self.icomments[ifile].strip()
+
+        comment_text = re.sub('[\n\t ]+', ' ', comment)
+
+        oneliner = include_stub + ((' // ' + comment_text) if comment_text else '')
+        if len(oneliner) <= self.line_length:
+            return oneliner + '\n'
+        else:
+            lines = [('// %s' % line) for line in textwrap.wrap(comment_text, width=(self.line_length - len('// ')))]
+            lines.append(include_stub)
+            return '\n'.join(lines) + '\n'
+
+    def _print_cached(self):
+        logging.debug('Printing cache...')
+        self._prepare_includes()
+        data_to_print = [
+            ([i for i in [self.mother] if i], '"', '"'),
+            (self.sys_includes, '<', '>'), (self.abs_includes, '<', '>'), (self.rel_includes, '"', '"')
+        ]
+        groups = [(g, pre, post) for data, pre, post in data_to_print
+                  for g in _reference_split_groups(data, key=self._include_sequence.group_id) if g]
+        groups = [''.join(self._include_text(include, pre, post) for include in group) for group, pre, post in groups]
+        print('\n'.join(groups), end='')
+
+    def _reset(self):
+        logging.debug('Resetting cached data..')
+        self.sys_includes = set()
+        self.abs_includes = set()
+        self.rel_includes = set()
+        self.mother = None
+        self.icomments.clear()
+
+
+def reference_lines(text):
+    """ Split text into lines like the original arrange_includes read its file (ie. in text mode). """
+    return io.StringIO(text, newline=None).readlines()
+
+
+def reference_arrange(text, original_name, git_root, include_sequence=None):
+    """ Original arrange_includes, on the file content text; returns the printed result. """
+    arranger = ReferenceIncludeArranger(git_root, original_name, include_sequence=include_sequence)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        for line in reference_lines(text):
+            arranger.feed(line)
+        arranger.empty_cache()
+    return output.getvalue()
+
+
+########################################################################################################################
+
+
+NAMES = ['componentA', 'componentB', 'sub0', 'sub1', 'util', 'remainder', 'a.H', 'b.h', 'iostream', 'vector', 'x']
+
+
+def random_path(rng, max_depth=4):
+    return '/'.join(rng.choice(NAMES) for _ in range(rng.randint(1, max_depth)))
+
+
+def random_comment(rng):
+    return rng.choice(['', ' ', ' text', 'x', ' // nested', ' /* nested', ' a /* b', '*', ' ** ', ' "quoted" ',
+                       ' page\f', '\x0b', ' \x1c\x1d\x1e', ' \x85', ' \u2028\u2029 '])
+
+
+def random_line(rng):
+    """ Return one (or, for multi line comments, several) random lines of C/C++-ish code. """
+    kind = rng.random()
+    if kind < 0.4:
+        include = random_path(rng)
+        line = '#include ' + ('<%s>' if rng.random() < 0.7 else '"%s"') % include
+        trailer = rng.random()
+        if trailer < 0.3:
+            line += rng.choice([' ', '  ', '\t']) + '//' + random_comment(rng)
+        elif trailer < 0.5:
+            line += ' /*' + random_comment(rng) + '*/'
+        elif trailer < 0.55:
+            line += ' /*' + random_comment(rng) + '\n' + random_comment(rng) + '*/'
+        return rng.choice(['', ' ', '  ']) + line
+    elif kind < 0.55:
+        return ''
+    elif kind < 0.6:
+        return rng.choice(['\f', '\x0b', ' \f ', '\x1c', '\x85', '\u2028'])  # Not line breaks in files
+    elif kind < 0.7:
+        return '//' + random_comment(rng)
+    elif kind < 0.8:
+        return '/*' + '\n'.join(random_comment(rng) for _ in range(rng.randint(1, 3))) + '*/'
+    elif kind < 0.85:
+        return '/*' + random_comment(rng) + '*/ /*' + random_comment(rng) + '*/' + rng.choice(['', ' code'])
+    return rng.choice(['int x;', 'namespace A {', '}', '  f(); // call', 'a = b /* c */ + d;', '#define X 1',
+                       'int y;\f', 'f(\x0b);'])
+
+
+def random_code(rng, max_lines=30):
+    """ Return random file content as list of lines including their line breaks (LF or CRLF, for all lines or mixed),
+        except that the last line might lack one. It never ends inside of a /* ... */ comment.
+    """
+    lines = '\n'.join(random_line(rng) for _ in range(rng.randint(0, max_lines))).split('\n')
+    endings = rng.choice([['\n'], ['\r\n'], ['\n', '\r\n']])
+    result = [line + rng.choice(endings) for line in lines]
+    if result and rng.random() < 0.2:
+        result[-1] = lines[-1]
+    return result
+
+
+def random_sequencer(rng):
+    sequencer = IncludeSequencer()
+    for _ in range(rng.randint(0, 3)):
+        nodes = [sequencer.add_root()]
+        for _ in range(rng.randint(0, 8)):
+            parent = rng.choice(nodes)
+            nodes.append(parent.insert(rng.choice(NAMES), descendable=rng.random() < 0.5))
+    return sequencer
+
+
+########################################################################################################################
+
+
+def shrink(lines, fails):
+    """ Return a minimal sublist of lines (by removing chunks of lines, then single lines) for which fails holds. """
+    chunk = max(1, len(lines) // 2)
+    while chunk:
+        start = 0
+        while start < len(lines):
+            candidate = lines[:start] + lines[start + chunk:]
+            if candidate != lines and fails(candidate):
+                lines = candidate
+            else:
+                start += chunk
+        chunk //= 2
+    return lines
+
+
+def outcome(function, *args, **kwargs):
+    """ Return the result of calling function, or the type of the exception it raised. """
+    try:
+        return 'ok', function(*args, **kwargs)
+    except Exception as e:
+        return 'error', type(e).__name__
+
+
+def check_equivalent(rng, num_cases, generate, reference, optimized):
+    """ Compare reference and optimized on num_cases generated inputs; fail with a shrunk input on any difference.
+
+    :param generate: Callable rng -> list of lines (eg. random_code).
+    """
+    def fails(lines):
+        return outcome(reference, lines) != outcome(optimized, lines)
+
+    for case in range(num_cases):
+        lines = generate(rng)
+        if fails(lines):
+            lines = shrink(lines, fails)
+            raise AssertionError('Case %d differs (shrunk): %r\nreference: %r\noptimized: %r' % (
+                case, lines, outcome(reference, lines), outcome(optimized, lines)))
@@ -0,0 +1,53 @@
+import concurrent.futures
+
+import pytest
+
+from tidycxx.aio import arrange_files
+from tidycxx.batch import CHANGED, FIXED, TIDY, is_failing
+from tidycxx.includes import arrange_code
+
+
+class TestAsyncArranging:
+
+    tidy = '''#include <iostream>
+
+int main() {}
+'''
+    untidy = '''#include <vector>
+#include <iostream>
+
+int main() {}
+'''
+
+    @pytest.fixture
+    def source_files(self, tmp_path):
+        paths = []
+        for num in range(20):
+            path = tmp_path / ('file%02d.C' % num)
+            path.write_text(self.untidy if num % 2 else self.tidy)
+            paths.append(str(path))
+        return paths
+
+    def test_in_place(self, source_files):
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            statuses = arrange_files(source_files, git_root='/home/john/work/', executor=executor, prefetch=2)
+        assert sorted(statuses) == sorted(source_files)
+        for num, path in enumerate(source_files):
+            assert statuses[path] == (FIXED if num % 2 else TIDY)
+            original = self.untidy if num % 2 else self.tidy
+            with open(path) as result:
+                assert arrange_code(original, path, '/home/john/work/') == result.read()
+
+    def test_check_only(self, source_files):
+        statuses = arrange_files(source_files, git_root='/home/john/work/', in_place=False, num_parsers=2)
+        assert 10 == list(statuses.values()).count(CHANGED)
+        with open(source_files[1]) as untouched:
+            assert self.untidy == untouched.read()
+
+    def test_errors_per_file(self, source_files, tmp_path):
+        missing = str(tmp_path / 'missing.C')
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            statuses = arrange_files([missing] + source_files, git_root='/home/john/work/', executor=executor)
+        assert statuses[missing].startswith('error: FileNotFoundError')
+        assert 10 == list(statuses.values()).count(FIXED)
+        assert 1 == sum(is_failing(status) for status in statuses.values())
@@ -0,0 +1,182 @@
+import io
+import json
+import os
+import shutil
+
+import pytest
+
+from tidycxx.batch import (FIXED, TIDY, IncludeTool, Journal, Progress, main, merge_reports, make_report, run, scan,
+                           scan_keyed, select_shard)
+from tidycxx.includes import write_atomic
+
+
+TIDY_CODE = '#include <iostream>\n\nint main() {}\n'
+UNTIDY_CODE = '#include <vector>\n#include <iostream>\n'
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for num in range(30):
+        path = tmp_path / ('dir%d' % (num % 3)) / ('file%02d.C' % num)
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(UNTIDY_CODE if num % 10 == 0 else TIDY_CODE * (num + 1))
+    (tmp_path / 'notes.txt').write_text('not C++')
+    (tmp_path / '.hidden').mkdir()
+    (tmp_path / '.hidden' / 'skipped.C').write_text(UNTIDY_CODE)
+    return tmp_path
+
+
+class TestSharding:
+
+    @pytest.mark.parametrize('balance', ['hash', 'size'])
+    def test_partition(self, tree, balance):
+        files = scan([str(tree)])
+        assert 30 == len(files)
+        shards = [select_shard(files, shard, 4, balance=balance) for shard in range(1, 5)]
+        assert sorted(path for path, _ in files) == sorted(path for shard in shards for path in shard)
+        assert shards == [select_shard(files[::-1], shard, 4, balance=balance) for shard in range(1, 5)]
+
+    @pytest.mark.parametrize('balance', ['hash', 'size'])
+    def test_checkouts_agree(self, tree, tmp_path_factory, balance):
+        shards = []
+        for checkout in ['ci', 'worker/other']:
+            src = tmp_path_factory.mktemp('checkouts') / checkout / 'src'
+            shutil.copytree(str(tree), str(src))
+            files, keys = scan_keyed([str(src)])
+            shards.append([[keys[path] for path in select_shard(files, shard, 4, balance=balance, key=keys.get)]
+                           for shard in range(1, 5)])
+        assert shards[0] == shards[1]
+        assert 'dir0/file00.C' in [key for shard in shards[0] for key in shard]
+
+    def test_symlink_loop(self, tree):
+        os.symlink('..', str(tree / 'dir0' / 'up'))
+        assert 30 == len(scan([str(tree)]))
+
+    def test_size_balance(self, tree):
+        files = scan([str(tree)])
+        sizes = dict(files)
+        loads = [sum(sizes[p] for p in select_shard(files, shard, 3, balance='size')) for shard in range(1, 4)]
+        assert max(loads) - min(loads) <= max(sizes.values())
+
+    def test_check_and_merge(self, tree, tmp_path, capsys):
+        reports = [str(tmp_path / ('report%d.json' % shard)) for shard in range(1, 4)]
+        for shard, report in enumerate(reports, 1):
+            main(['run', '--check', '--git-root', str(tree), '--shard', '%d/3' % shard, '--report', report, str(tree)])
+        capsys.readouterr()
+
+        assert 1 == main(['merge'] + reports)
+        assert capsys.readouterr().out.endswith('FAIL: 30 files, 3 failed\n')
+        assert 1 == main(['merge'] + reports[:2])
+        assert 'Missing reports of shards 3' in capsys.readouterr().out
+
+        with pytest.raises(SystemExit):
+            main(['merge', reports[0], reports[0]])
+        assert 'Several reports of shards 1' in capsys.readouterr().err
+
+        assert 0 == main(['run', '--git-root', str(tree), '--jobs', '2', str(tree)])
+        assert 0 == main(['run', '--check', '--git-root', str(tree), '--report', reports[0], str(tree)])
+        with open(reports[0]) as report:
+            assert 0 == json.load(report)['failed']
+
+
+    def test_merge_mismatched_reports(self):
+        with pytest.raises(ValueError):
+            merge_reports([make_report({}, shard=(1, 2)), make_report({}, shard=(2, 3))])
+        with pytest.raises(ValueError):
+            merge_reports([make_report({}, shard=(1, 2)), make_report({}, shard=(1, 2))])
+        assert [2] == merge_reports([make_report({}, shard=(1, 2))])['missing_shards']
+
+    def test_diff(self, tree, capsys):
+        assert 1 == main(['diff', '--format', 'edits', '--git-root', str(tree), str(tree)])
+        edits = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert 3 == len(edits)
+        assert {'start': 1, 'end': 3, 'text': '#include <iostream>\n#include <vector>\n'} == \
+            {key: edits[0][key] for key in ('start', 'end', 'text')}
+        assert not (tree / 'dir0' / 'file00.C').read_text().startswith('#include <iostream>')
+
+    def test_missing_final_newline(self, tmp_path, capsys):
+        path = tmp_path / 'mom.C'
+        path.write_text('#include <a>\nint x;')
+        assert 1 == main(['run', '--check', '--git-root', str(tmp_path), str(path)])
+        assert '%s: changed' % path in capsys.readouterr().out
+        assert 1 == main(['diff', '--git-root', str(tmp_path), str(path)])
+        assert capsys.readouterr().out.endswith(
+            '@@ -1,2 +1,2 @@\n #include <a>\n-int x;\n\\ No newline at end of file\n+int x;\n')
+
+
+class _CountingTool(IncludeTool):
+    def __init__(self, git_root):
+        IncludeTool.__init__(self, git_root)
+        self.calls = []
+
+    def __call__(self, path, in_place):
+        self.calls.append(path)
+        return IncludeTool.__call__(self, path, in_place)
+
+
+class TestResuming:
+
+    def test_journal(self, tree, tmp_path):
+        paths = [path for path, _ in scan([str(tree)])]
+        journal_file = str(tmp_path / 'journal')
+
+        tool = _CountingTool(str(tree))
+        journal = Journal(journal_file)
+        statuses = run(tool, paths[:10], in_place=True, journal=journal)
+        journal.close()
+        assert [FIXED] == [s for s in statuses.values() if s != TIDY]
+
+        with open(journal_file, 'a') as out:
+            out.write('truncated li')  # Interrupted while writing
+        modified = str(tree / 'dir0' / 'file03.C')
+        assert modified in paths[:10]
+        with open(modified, 'w') as out:
+            out.write(UNTIDY_CODE)  # Modified since
+
+        tool = _CountingTool(str(tree))
+        journal = Journal(journal_file)
+        statuses = run(tool, paths, in_place=True, journal=journal, progress=Progress(len(paths), io.StringIO()))
+        journal.close()
+        assert sorted([modified] + paths[10:]) == sorted(tool.calls)
+        assert len(paths) == len(statuses)
+        assert 4 == list(statuses.values()).count(FIXED)
+
+    def test_progress(self):
+        stream = io.StringIO()
+        progress = Progress(4, stream, interval=3600)
+        for _ in range(4):
+            progress.update()
+        assert stream.getvalue().startswith('\r4/4 files, ')
+        assert stream.getvalue().endswith(', ETA 0s\n')
+
+    def test_atomic_write(self, tmp_path):
+        path = tmp_path / 'file.C'
+        path.write_text('original')
+        os.chmod(str(path), 0o640)
+        with pytest.raises(TypeError):
+            write_atomic(str(path), None)
+        assert 'original' == path.read_text()
+        write_atomic(str(path), 'replaced')
+        assert 'replaced' == path.read_text()
+        assert 0o640 == os.stat(str(path)).st_mode & 0o777
+        assert ['file.C'] == os.listdir(str(tmp_path))
+
+    def test_atomic_write_links(self, tmp_path):
+        real, hard = tmp_path / 'real.C', tmp_path / 'hard.C'
+        real.write_text('original')
+        os.symlink('real.C', str(tmp_path / 'link.C'))
+        write_atomic(str(tmp_path / 'link.C'), 'via symlink')
+        assert os.path.islink(str(tmp_path / 'link.C'))
+        assert 'via symlink' == real.read_text()
+
+        os.link(str(real), str(hard))
+        with pytest.raises(OSError):
+            write_atomic(str(hard), 'via hard link')
+        assert 'via symlink' == hard.read_text()
+        assert os.path.samefile(str(real), str(hard))
+        assert ['hard.C', 'link.C', 'real.C'] == sorted(os.listdir(str(tmp_path)))
+
+        real.write_text(UNTIDY_CODE)
+        statuses = run(IncludeTool(str(tmp_path)), [str(hard)], in_place=True)
+        assert statuses[str(hard)].startswith('error: OSError: ')
+        assert UNTIDY_CODE == hard.read_text()
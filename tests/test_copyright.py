@@ -0,0 +1,63 @@
+import pytest
+
+from tidycxx.batch import CHANGED, FIXED, TIDY
+from tidycxx.copyright import BannerTool, main, read_leading_region
+
+CODE = '#include <iostream>\n\nint main() {}\n'
+
+
+@pytest.fixture
+def tool():
+    return BannerTool('ACME Corp.', year=2026)
+
+
+class TestBannerFixing:
+
+    @pytest.mark.parametrize('header, expected', [
+        ('// Copyright (c) 2026 ACME Corp.\n', '// Copyright (c) 2026 ACME Corp.\n'),
+        ('// Copyright (c) 2019 ACME Corp.\n', '// Copyright (c) 2019-2026 ACME Corp.\n'),
+        ('/*\n * Copyright 2019 - 2024 ACME Corp.\n */\n\n', '/*\n * Copyright 2019 - 2026 ACME Corp.\n */\n\n'),
+        ('// COPYRIGHT 2010, 2015 ACME Corp.\n', '// COPYRIGHT 2010, 2015-2026 ACME Corp.\n'),
+        ('', '// Copyright (c) 2026 ACME Corp.\n\n'),
+        ('// Some file\n', '// Copyright (c) 2026 ACME Corp.\n\n// Some file\n'),
+        ('\n// Copyright 2019 Other Inc.\n', '// Copyright (c) 2026 ACME Corp.\n\n// Copyright 2019 Other Inc.\n'),
+    ])
+    def test_fix(self, tool, tmp_path, header, expected):
+        path = tmp_path / 'file.C'
+        path.write_text(header + CODE)
+        status = tool(str(path), in_place=True)
+        assert expected + CODE == path.read_text()
+        assert status == (TIDY if header == expected else FIXED)
+        assert TIDY == tool(str(path), in_place=True)
+
+    def test_banner_after_code_is_ignored(self, tool, tmp_path):
+        path = tmp_path / 'file.C'
+        path.write_text(CODE + '// Copyright 2026 ACME Corp.\n')
+        assert CHANGED == tool(str(path), in_place=False)
+        assert CODE + '// Copyright 2026 ACME Corp.\n' == path.read_text()
+
+    def test_stops_reading_at_code(self, tmp_path):
+        path = tmp_path / 'file.C'
+        path.write_text('/* a\n b */\n\nint x; // c\n' + 'int y;\n' * 1000)
+        with open(str(path)) as src:
+            region, comments, code_line = read_leading_region(src)
+            assert 'int y;\n' == next(src)
+        assert ['/* a\n', ' b */\n', '\n'] == region
+        assert [' a\n b '] == comments
+        assert 'int x; // c\n' == code_line
+
+    def test_invalid_template(self):
+        with pytest.raises(ValueError):
+            BannerTool('ACME Corp.', template='/* (C) {years} {holder} */')
+
+    def test_template_and_cli(self, tmp_path, capsys):
+        template = tmp_path / 'banner.txt'
+        template.write_text('/* Copyright {years} {holder} */')
+        (tmp_path / 'src').mkdir()
+        path = tmp_path / 'src' / 'file.C'
+        path.write_text(CODE)
+        assert 1 == main(['--holder', 'ACME Corp.', '--year', '2020', '--check', str(tmp_path / 'src')])
+        assert 0 == main(['--holder', 'ACME Corp.', '--template', str(template), '--year', '2020', '--jobs', '2',
+                          str(tmp_path / 'src')])
+        assert '/* Copyright 2020 ACME Corp. */\n\n' + CODE == path.read_text()
+        assert 0 == main(['--holder', 'ACME Corp.', '--year', '2020', '--check', str(tmp_path / 'src')])
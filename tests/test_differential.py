@@ -0,0 +1,136 @@
+""" Differential tests comparing optimized code paths with the reference implementations on random inputs.
+
+    Set TIDYCXX_FUZZ_CASES to run more cases per test (eg. before switching on a new performance mode).
+"""
+
+import concurrent.futures
+import io
+import os
+import random
+
+import pytest
+
+from differential import (check_equivalent, random_code, random_path, random_sequencer, reference_arrange,
+                          reference_calls, reference_lines, reference_sort_id, shrink)
+from tidycxx.comments import CommentParser
+from tidycxx.includes import IncludeArranger, apply_edits, arrange_code, arrange_edits, arrange_includes
+from tidycxx.passes import (OLD_COMMENT, NEW_COMMENT, END_OF_LINE, INPUT_LINE, include_pipeline, tokenize,
+                            tokenize_chunked)
+from tidycxx.server import TidyServer
+
+NUM_CASES = int(os.environ.get('TIDYCXX_FUZZ_CASES', 200))
+GIT_ROOT = '/home/john/work/'
+
+
+@pytest.fixture
+def rng(request):
+    return random.Random(request.node.name)
+
+
+def _calls(tokens):
+    names = {OLD_COMMENT: 'old', NEW_COMMENT: 'new', END_OF_LINE: 'eol'}
+    return [(names.get(kind, 'code'), text) for kind, text in zip(tokens.kinds, tokens.texts) if kind != INPUT_LINE]
+
+
+def _lines(raw_lines):
+    return reference_lines(''.join(raw_lines))
+
+
+def _applied_edits(raw_lines, sequencer):
+    lines = _lines(raw_lines)
+    return apply_edits(lines, arrange_edits(lines, 'prjA/mom.C', GIT_ROOT, sequencer))
+
+
+class TestDifferential:
+
+    def test_shrink(self):
+        assert [3, 7] == shrink(list(range(10)), lambda lines: 3 in lines and 7 in lines)
+
+    def test_comment_parser(self, rng):
+        class Recorder(CommentParser):
+            def __init__(self):
+                CommentParser.__init__(self)
+                self.calls = []
+                self.handle_code = lambda code: self.calls.append(('code', code))
+                self.handle_old_comment = lambda comment: self.calls.append(('old', comment))
+                self.handle_new_comment = lambda comment: self.calls.append(('new', comment))
+                self.handle_end_of_line = lambda: self.calls.append(('eol', None))
+
+        def parse(lines):
+            recorder = Recorder()
+            for line in lines:
+                recorder.feed(line)
+            return recorder.calls
+
+        def reference(raw_lines):
+            return reference_calls(_lines(raw_lines))
+
+        check_equivalent(rng, NUM_CASES, random_code, reference, lambda raw_lines: parse(_lines(raw_lines)))
+        check_equivalent(rng, NUM_CASES, random_code, reference, lambda raw_lines: _calls(tokenize(_lines(raw_lines))))
+
+    def test_chunked_tokenizing(self, rng):
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            check_equivalent(rng, NUM_CASES, lambda r: random_code(r, 60), lambda lines: reference_calls(_lines(lines)),
+                             lambda lines: _calls(tokenize_chunked(_lines(lines), chunk_lines=rng.randint(1, 10),
+                                                                   executor=executor)))
+
+    def test_sort_ids(self, rng):
+        for _ in range(NUM_CASES):
+            sequencer = random_sequencer(rng)
+            blocks = [[random_path(rng) for _ in range(rng.randint(0, 6))] for _ in range(rng.randint(0, 5))]
+            for block in blocks:
+                for include in block:
+                    assert reference_sort_id(sequencer, include) == sequencer.sort_id(include), include
+                    assert reference_sort_id(sequencer, include) + include == sequencer.sort_key(include), include
+            expected = [sorted(set(block), key=lambda x: reference_sort_id(sequencer, x) + x) for block in blocks]
+            assert expected == sequencer.order_blocks(blocks)
+
+    @pytest.mark.parametrize('max_buffered_lines', [IncludeArranger.max_buffered_lines, 2])
+    def test_arranging(self, rng, tmp_path, monkeypatch, max_buffered_lines):
+        monkeypatch.setattr(IncludeArranger, 'max_buffered_lines', max_buffered_lines)  # 2: spill most comment runs
+        sequencer = random_sequencer(rng)
+        pipeline = include_pipeline(GIT_ROOT, include_sequence=sequencer)
+        chunked = include_pipeline(GIT_ROOT, include_sequence=sequencer, chunk_lines=3,
+                                   executor=concurrent.futures.ThreadPoolExecutor(2))
+        server = TidyServer(git_root=GIT_ROOT)
+        server._sequencer = sequencer  # Skip config handling
+        src_file = str(tmp_path / 'mom.C')
+
+        def reference(lines):
+            return reference_arrange(''.join(lines), 'prjA/mom.C', GIT_ROOT, sequencer)
+
+        def streamed(lines):
+            with open(src_file, 'w', newline='') as out:  # Keep line breaks as generated
+                out.write(''.join(lines))
+            output = io.StringIO()
+            arrange_includes(src_file, git_root=GIT_ROOT, output=output, chunk_size=rng.randint(1, 100))
+            return output.getvalue()
+
+        def served(lines):
+            response = server.handle({'code': ''.join(lines), 'path': 'prjA/mom.C'})
+            if 'error' in response:
+                raise RuntimeError(response['error'])
+            return response['code']
+
+        check_equivalent(rng, NUM_CASES, random_code, reference,
+                         lambda lines: pipeline.run(''.join(lines), 'prjA/mom.C')[0])
+        check_equivalent(rng, NUM_CASES, random_code, reference,
+                         lambda lines: chunked.run(''.join(lines), 'prjA/mom.C')[0])
+        check_equivalent(rng, NUM_CASES, random_code, reference,
+                         lambda lines: _applied_edits(lines, sequencer))
+        check_equivalent(rng, NUM_CASES // 4, random_code, reference, served)
+        check_equivalent(rng, NUM_CASES // 4, random_code,
+                         lambda lines: reference_arrange(''.join(lines), src_file, GIT_ROOT), streamed)
+        chunked.executor.shutdown()
+
+    def test_long_comment_runs(self, tmp_path):
+        src_file = str(tmp_path / 'mom.C')
+        for code in ['// License\n' * 1001 + '#include <b>\n#include <a>\n',
+                     '\n/* License\n' + ' * text\n' * 1500 + ' */\n// more\n' * 600 + '#include <b>\n\nint x;\n']:
+            expected = reference_arrange(code, src_file, GIT_ROOT)
+            assert expected == arrange_code(code, src_file, GIT_ROOT)
+            with open(src_file, 'w') as out:
+                out.write(code)
+            output = io.StringIO()
+            arrange_includes(src_file, git_root=GIT_ROOT, output=output)
+            assert expected == output.getvalue()
@@ -0,0 +1,136 @@
+import array
+import random
+import time
+
+import pytest
+
+from tidycxx.graph import IncludeGraph, main, remove_redundant_includes
+
+
+@pytest.fixture
+def tree(tmp_path):
+    files = {
+        'base/types.H': '#include <cstdint>\n',
+        'base/log.H': '#include <base/types.H>\n#include <string>\n',
+        'app/main.C': '#include "main.H"\n\n#include <base/log.H>\n#include <base/types.H>\n\nint main() {}\n',
+        'app/main.H': '#include <base/types.H>\n',
+        'app/util.C': '#include <base/log.H>\n',
+        'tools/tool.C': '#include <vector>\n',
+    }
+    for name, content in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(content)
+    return tmp_path
+
+
+# Generous budget (in seconds) for all reports on a synthetic graph of 20k files; guards against quadratic closures.
+REPORT_BUDGET_S = 5
+
+
+def synthetic_graph(num_nodes, module_size=100, seed=0):
+    """ Return a graph of num_nodes // 4 translation units including headers grouped into modules, whose headers
+        include headers of their own module and of the first (base) module, which closes some cycles.
+    """
+    rng = random.Random(seed)
+    num_tus = num_nodes // 4
+    edges = []
+    for node in range(num_nodes):
+        if node < num_tus:
+            edges.append(sorted(set(rng.randrange(num_tus, num_nodes) for _ in range(5))))
+        else:
+            module_end = min(num_nodes, num_tus + ((node - num_tus) // module_size + 1) * module_size)
+            targets = set(rng.randrange(node, module_end) for _ in range(2)) | {num_tus + rng.randrange(module_size)}
+            edges.append(sorted(targets - {node}))
+    offsets = array.array('l', [0])
+    for targets in edges:
+        offsets.append(offsets[-1] + len(targets))
+    return IncludeGraph(['f%d.H' % node for node in range(num_nodes)], array.array('l', range(num_tus)), offsets,
+                        array.array('l', [t for targets in edges for t in targets]),
+                        array.array('l', [rng.randint(0, 1000) for _ in range(num_nodes)]))
+
+
+class TestIncludeGraph:
+
+    def test_build(self, tree):
+        graph = IncludeGraph.build(str(tree))
+        assert ['app/main.C', 'app/util.C', 'tools/tool.C'] == sorted(graph.paths[n] for n in graph.translation_units)
+        main_includes = sorted(graph.paths[n] for n in graph.includes(graph.ids['app/main.C']))
+        assert ['app/main.H', 'base/log.H', 'base/types.H'] == main_includes
+        assert 0 == graph.sizes[graph.ids['string']]  # External include
+
+    def test_quoted_include_with_folder(self, tree):
+        (tree / 'app/detail').mkdir()
+        (tree / 'app/detail/impl.H').write_text('#include <string>\n')
+        (tree / 'app/util.C').write_text('#include "detail/impl.H"\n#include <base/log.H>\n')
+        graph = IncludeGraph.build(str(tree))
+        assert 'detail/impl.H' not in graph.ids
+        util_includes = set(graph.paths[n] for n in graph.includes(graph.ids['app/util.C']))
+        assert {'app/detail/impl.H', 'base/log.H'} == util_includes
+
+    def test_reports(self, tree):
+        graph = IncludeGraph.build(str(tree))
+        assert ('base/types.H', 3) == graph.most_included(1)[0]
+        costs = graph.include_costs()
+        assert ['app/main.C', 'app/util.C', 'tools/tool.C'] == [c[0] for c in costs]
+        assert 5 == costs[0][1]  # main.H, log.H, types.H, cstdint, string
+        assert ['base/log.H', 'base/types.H'] == [c[0] for c in graph.pch_candidates(min_share=0.6)]  # By bytes
+
+    def test_persistence(self, tree, tmp_path, capsys):
+        index = str(tmp_path / 'index.json')
+        main(['build', str(tree), '--index', index])
+        graph, loaded = IncludeGraph.build(str(tree)), IncludeGraph.load(index)
+        assert graph.paths == loaded.paths
+        assert graph.include_costs() == loaded.include_costs()
+
+        main(['report', '--index', index, '--top', '1'])
+        assert 'base/types.H\t3' in capsys.readouterr().out
+
+    def test_closure_with_cycle(self, tree):
+        (tree / 'base/a.H').write_text('#include <base/b.H>\n')
+        (tree / 'base/b.H').write_text('#include <base/a.H>\n#include <base/log.H>\n')
+        graph = IncludeGraph.build(str(tree))
+        closure_a = graph.closure(graph.ids['base/a.H'])
+        assert closure_a == graph.closure(graph.ids['base/b.H'])  # Same within the cycle
+        assert {'base/a.H', 'base/b.H', 'base/log.H', 'base/types.H', 'string', 'cstdint'} == \
+            set(graph.paths[n] for n in closure_a)
+
+    def test_redundant_includes(self, tree, capsys):
+        graph = IncludeGraph.build(str(tree))
+        ids = graph.ids
+        assert [(ids['base/types.H'], ids['base/log.H'])] == graph.redundant_includes(ids['app/main.C'])
+        assert [] == graph.redundant_includes(ids['app/util.C'])
+
+        main(['redundant', str(tree), '--remove'])
+        assert 'app/main.C: base/types.H is included through base/log.H\n' == capsys.readouterr().out
+        assert '#include "main.H"\n\n#include <base/log.H>\n\nint main() {}\n' == (tree / 'app/main.C').read_text()
+        assert [] == remove_redundant_includes(IncludeGraph.build(str(tree)), str(tree), 'app/main.C')
+
+    def test_remove_only_include_lines(self, tree):
+        code = ('#include <base/types.H> // Goes with its line\n#include <zlib.h>\n#include <base/log.H>\n'
+                '/* Unsorted, stays unsorted\n#include <base/types.H>\n*/\n#include <base/types.H> /* A\n*/\n')
+        (tree / 'app/util.C').write_text(code)
+        graph = IncludeGraph.build(str(tree))
+        assert ['base/types.H'] == remove_redundant_includes(graph, str(tree), 'app/util.C')
+        assert ('#include <zlib.h>\n#include <base/log.H>\n/* Unsorted, stays unsorted\n#include <base/types.H>\n*/\n'
+                '#include <base/types.H> /* A\n*/\n') == (tree / 'app/util.C').read_text()
+
+    def test_closures_of_synthetic_graph(self):
+        graph = synthetic_graph(400, module_size=20)
+        for node in range(len(graph)):
+            reached, todo = set(), list(graph.includes(node))
+            while todo:
+                target = todo.pop()
+                if target not in reached:
+                    reached.add(target)
+                    todo.extend(graph.includes(target))
+            assert reached == graph.closure(node)
+
+    def test_report_scaling(self):
+        graph = synthetic_graph(20000)
+        start = time.perf_counter()
+        graph.include_costs()
+        graph.pch_candidates()
+        for node in graph.translation_units:
+            graph.redundant_includes(node)
+        assert time.perf_counter() - start < REPORT_BUDGET_S
@@ -0,0 +1,66 @@
+import subprocess
+import sys
+
+# Generous budget (in microseconds) for importing the package; mainly guards against accidentally heavy imports.
+IMPORT_BUDGET_US = 50000
+
+# Modules only required on rare paths, which must not be loaded when tidying files that are tidy already.
+LAZY_MODULES = ['logging', 'subprocess', 'textwrap']
+
+FAST_PATH = '''
+import sys
+from tidycxx.includes import arrange_code
+code = '#include <iostream>\\n\\nint main() {}\\n'
+assert arrange_code(code, 'mom.C', '/') == code
+print(' '.join(sorted(sys.modules)))
+'''
+
+# Same for the console entry point (see setup.py), run like a pre-commit hook on a single tidy file
+ENTRY_POINT = '''
+import sys
+from tidycxx.batch import main
+with open(sys.argv[1], 'w') as out:
+    out.write('#include <iostream>\\n\\nint main() {}\\n')
+assert main(['run', '--check', '--git-root', '/', sys.argv[1]]) == 0
+print(' '.join(sorted(sys.modules)))
+'''
+
+
+def _run_python(*args):
+    return subprocess.run([sys.executable, '-X', 'importtime'] + list(args),
+                          check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def _import_times(stderr):
+    # Lines look like: 'import time:       596 |       6952 |   tidycxx.comments'
+    times = {}
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_time_budget():
+    times = _import_times(_run_python('-c', 'import tidycxx.includes').stderr)
+    assert 'tidycxx.includes' in times
+    assert times['tidycxx'] + times['tidycxx.includes'] < IMPORT_BUDGET_US
+
+
+def test_entry_point_import_time_budget():
+    times = _import_times(_run_python('-c', 'import tidycxx.batch').stderr)
+    assert 'tidycxx.batch' in times
+    assert times['tidycxx'] + times['tidycxx.batch'] < IMPORT_BUDGET_US
+
+
+def test_fast_path_imports():
+    modules = _run_python('-c', FAST_PATH).stdout.split()
+    assert 'tidycxx.includes' in modules
+    assert [] == [m for m in LAZY_MODULES if m in modules]
+
+
+def test_entry_point_imports(tmp_path):
+    modules = _run_python('-c', ENTRY_POINT, str(tmp_path / 'mom.C')).stdout.split()
+    assert 'tidycxx.batch' in modules
+    assert [] == [m for m in LAZY_MODULES + ['concurrent.futures', 'json'] if m in modules]
@@ -0,0 +1,120 @@
+import concurrent.futures
+
+import pytest
+
+from tidycxx import includes
+from tidycxx.comments import CommentParser
+from tidycxx.copyright import BannerTool
+from tidycxx.includes import arrange_code
+from tidycxx.passes import END_OF_LINE, include_pipeline, tokenize, tokenize_chunked
+
+
+class CommentSpaceChecker(CommentParser):
+    def __init__(self, original_name):
+        CommentParser.__init__(self)
+        self.original_name = original_name
+        self.findings = []
+
+    def handle_code(self, code):
+        pass
+
+    def handle_old_comment(self, comment):
+        self.handle_new_comment(comment)
+
+    def handle_new_comment(self, comment):
+        if not comment.startswith(' '):
+            self.findings.append('%s: missing space in comment %s' % (self.original_name, comment))
+
+    def handle_end_of_line(self):
+        pass
+
+
+class TestPasses:
+
+    code = '''/* multi
+line */
+#include <vector> //for std::vector
+#include <iostream> // for std::cout
+
+int main() { return 0; }
+'''
+
+    def test_tokenize(self):
+        tokens = tokenize(self.code.splitlines())
+        assert 5 == tokens.kinds.count(END_OF_LINE)  # Line break within the comment isn't an end of line
+        assert ' multi\nline ' in tokens.texts
+
+    def test_pipeline(self, tmp_path):
+        pipeline = include_pipeline(git_root='/home/john/work/')
+        pipeline.add_checker(CommentSpaceChecker)
+        path = tmp_path / 'mom.C'
+        path.write_text(self.code)
+
+        changed, findings = pipeline.run_file(str(path), in_place=True)
+        assert changed
+        assert ['%s: missing space in comment for std::vector' % path] == findings
+        assert arrange_code(self.code, str(path), '/home/john/work/') == path.read_text()
+
+        assert (False, []) == pipeline.run_file(str(path))
+
+    def test_splits_only_at_line_breaks(self):
+        code = '#include <a>\n\f\nint x;\x0b // \x1c\x85\u2028\n'
+        assert (code, []) == include_pipeline(git_root='/home/john/work/').run(code, 'mom.C')
+
+    @pytest.mark.parametrize('code, expected', [
+        # Disjoint edits are applied in a single round
+        ('// Copyright 2019 ACME Corp.\n\n#include <b>\n#include <a>\n\nint x;\n',
+         '// Copyright 2019-2026 ACME Corp.\n\n#include <a>\n#include <b>\n\nint x;\n'),
+        # Overlapping edits: the banner is inserted into the arranged code
+        ('#include <b>\n#include <a>\n', '// Copyright (c) 2026 ACME Corp.\n\n#include <a>\n#include <b>\n'),
+        ('// Some file\n#include <b>\n#include <a>\n',
+         '// Copyright (c) 2026 ACME Corp.\n\n#include <a>\n#include <b> // Some file\n'),
+    ])
+    def test_chained_rewriters(self, tmp_path, monkeypatch, code, expected):
+        writes = []
+        monkeypatch.setattr(includes, 'write_atomic', lambda path, text: writes.append(text))
+        pipeline = include_pipeline(git_root='/home/john/work/')
+        pipeline.add_rewriter(BannerTool('ACME Corp.', year=2026).rewriter)
+        pipeline.add_checker(CommentSpaceChecker)
+        path = tmp_path / 'mom.C'
+        path.write_text(code)
+
+        assert (True, []) == pipeline.run_file(str(path), in_place=True)
+        assert [expected] == writes
+        assert (expected, []) == pipeline.run(expected, str(path))
+
+
+class TestChunkedTokenizing:
+
+    code = '''#include <a> /* starts
+continues // not a comment
+*/ #include <b> // new /* not old
+/* one */ code /* two
+*/
+/**/
+/*
+long
+
+comment */ // trailing
+// done
+int x; /* unterminated
+'''
+
+    def _assert_same(self, code, chunk_lines, executor):
+        expected = tokenize(code.splitlines())
+        tokens = tokenize_chunked(code.splitlines(), chunk_lines=chunk_lines, executor=executor)
+        assert (expected.kinds, expected.texts) == (tokens.kinds, tokens.texts)
+
+    def test_chunk_sizes(self):
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            for chunk_lines in range(1, len(self.code.splitlines()) + 2):
+                self._assert_same(self.code, chunk_lines, executor)
+
+    def test_process_pool(self):
+        self._assert_same(self.code * 50, 7, None)
+
+    def test_pipeline_output(self):
+        code = TestPasses.code * 20 + self.code.replace('/* unterminated', '')
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            pipeline = include_pipeline(git_root='/home/john/work/', chunk_lines=5, executor=executor)
+            assert (arrange_code(code, 'mom.C', '/home/john/work/'), []) == pipeline.run(code, 'mom.C')
@@ -0,0 +1,81 @@
+import io
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from tidycxx.server import TidyServer, serve_socket, serve_stream
+
+
+class TestServer:
+
+    code = '''#include <componentB/b.H>
+
+#include <componentA/a.H>
+'''
+
+    @pytest.fixture
+    def config(self, tmp_path):
+        path = tmp_path / 'ordering.json'
+        path.write_text(json.dumps([['componentB', 'componentA']]))
+        return path
+
+    def test_request(self, config):
+        server = TidyServer(config=str(config))
+        response = server.handle({'id': 7, 'path': 'prjA/mom.C', 'code': self.code})
+        assert {'id': 7, 'code': self.code, 'changed': False} == response
+
+    def test_config_reload(self, config):
+        server = TidyServer(config=str(config))
+        sequencer = server.sequencer()
+        assert sequencer is server.sequencer()  # Warm
+
+        config.write_text(json.dumps([['componentA', 'componentB']]))
+        os.utime(str(config), ns=(0, 0))  # Ensure a different time stamp
+        assert sequencer is not server.sequencer()
+        response = server.handle({'id': 8, 'code': self.code})
+        assert response['changed']
+        assert '#include <componentA/a.H>\n\n#include <componentB/b.H>\n' == response['code']
+
+    def test_stream(self, config):
+        instream = io.StringIO('\n'.join([json.dumps({'id': 1, 'code': self.code}), '', 'no json', '{"id": 3}', '[1]', '3', '']))
+        outstream = io.StringIO()
+        serve_stream(TidyServer(config=str(config)), instream, outstream)
+        responses = [json.loads(line) for line in outstream.getvalue().splitlines()]
+        assert 5 == len(responses)
+        assert not responses[0]['changed']
+        assert all('error' in response for response in responses[1:])
+
+    def test_socket_path_not_replaced(self, tmp_path):
+        path = tmp_path / 'tidy.sock'
+        path.write_text('precious')
+        with pytest.raises(FileExistsError):
+            serve_socket(TidyServer(), str(path))
+        assert 'precious' == path.read_text()
+
+    def test_socket_in_use(self, tmp_path):
+        path = str(tmp_path / 'tidy.sock')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+            listener.bind(path)
+            listener.listen(1)
+            with pytest.raises(FileExistsError):
+                serve_socket(TidyServer(), path)
+        assert os.path.exists(path)  # Closed listener leaves a stale socket behind
+
+        thread = threading.Thread(target=serve_socket, args=(TidyServer(), path), daemon=True)
+        thread.start()
+        for _ in range(100):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                try:
+                    client.connect(path)
+                except (ConnectionRefusedError, FileNotFoundError):  # Not yet replaced or listening
+                    time.sleep(0.05)
+                    continue
+                client.sendall(b'{"id": 1, "code": "#include <b>\\n#include <a>\\n"}\n')
+                assert 1 == json.loads(client.makefile().readline())['id']
+                break
+        else:
+            pytest.fail('Stale socket was not replaced')
@@ -1,6 +1,12 @@
+import io
+import shutil
+import subprocess
+import tracemalloc
+
 import pytest
 
-from tidycxx.includes import IncludeSequencer, IncludeArranger
+from tidycxx.includes import IncludeSequencer, IncludeArranger, ChunkedWriter, arrange_includes
+from tidycxx.includes import Edit, apply_edits, arrange_code, arrange_edits, unified_diff
 from tidycxx.comments import CommentParser
 
 
@@ -44,6 +50,32 @@ class TestIncludeOrdering:
         expected = [id_subA00, id_subA01, idB, id_stl, id_dep0]
         assert sorted(expected) == expected
 
+    def test_order_blocks(self, test_sequencer):
+        headers = ['iostream', 'dep0.h', 'componentB/huhu/blah/moin.H', 'componentA/subA0/subA0a/hans.H',
+                   'componentA/subA1/subA1a/hans.H', 'componentA/subA0/subA0b/x.H', 'componentC/y.H']
+        blocks = [headers, headers[::-1], headers[2:5] + headers[2:3], [], headers[::3]]
+        expected = [sorted(set(block), key=lambda x: test_sequencer.sort_id(x) + x) for block in blocks]
+        assert expected == test_sequencer.order_blocks(blocks)
+
+    def test_sort_key_cache(self, test_sequencer):
+        include = 'componentC/y.H'
+        assert test_sequencer.sort_id(include) + include == test_sequencer.sort_key(include)
+        test_sequencer.add_root().insert('componentC')
+        assert test_sequencer.sort_id(include) + include == test_sequencer.sort_key(include)  # Not the cached one
+
+    def test_from_config(self, test_sequencer):
+        config = [[
+            {'name': 'componentA', 'descendable': True, 'children': [
+                {'name': 'subA0', 'descendable': True, 'children': [
+                    'subA0a', {'name': 'subA0b', 'descendable': True}]},
+                {'name': 'subA1', 'children': [{'name': 'subA1a', 'descendable': True}]}]},
+            'componentB']]
+        sequencer = IncludeSequencer.from_config(config)
+        for include in ['iostream', 'componentB/huhu/moin.H', 'componentA/subA0/subA0b/hans.H',
+                        'componentA/subA1/subA1a/hans.H', 'componentA/subA0/subA0a/hans.H']:
+            assert test_sequencer.sort_id(include) == sequencer.sort_id(include)
+            assert test_sequencer.group_id(include) == sequencer.group_id(include)
+
 ########################################################################################################################
 
 
@@ -508,6 +540,153 @@ namespace CPC {
         self.perform_test(include_arranger, capfd, code, expected)
 
 
+########################################################################################################################
+
+
+class _CountingSink:
+    def __init__(self):
+        self.num_chars = 0
+        self.num_writes = 0
+
+    def write(self, text):
+        self.num_chars += len(text)
+        self.num_writes += 1
+
+
+class TestStreaming:
+
+    block = '''// Some code
+#include <vector>
+#include <iostream> // for cout
+#include "local.H"
+
+int f() { return 0; }
+
+'''
+
+    def _peak_memory(self, src_file, sink):
+        tracemalloc.start()
+        try:
+            arrange_includes(str(src_file), git_root='/home/john/work/', output=sink, chunk_size=1 << 12)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_output_matches_arranger(self, tmp_path):
+        src_file = tmp_path / 'mom.C'
+        src_file.write_text(self.block * 100)
+        expected = io.StringIO()
+        arranger = IncludeArranger(git_root='/home/john/work/', original_name=str(src_file), output=expected)
+        for line in (self.block * 100).splitlines():
+            arranger.feed(line)
+        arranger.empty_cache()
+
+        result = io.StringIO()
+        arrange_includes(str(src_file), git_root='/home/john/work/', output=result)
+        assert expected.getvalue() == result.getvalue()
+
+    def test_bounded_memory(self, tmp_path):
+        small_file, large_file = tmp_path / 'small.C', tmp_path / 'large.C'
+        small_file.write_text(self.block * 100)
+        large_file.write_text(self.block * 10000)  # ~1MB
+
+        small_sink, large_sink = _CountingSink(), _CountingSink()
+        small_peak = self._peak_memory(small_file, small_sink)
+        large_peak = self._peak_memory(large_file, large_sink)
+        assert large_sink.num_chars > 500000
+        assert large_sink.num_writes < large_sink.num_chars / 1000  # Output is chunked
+        assert large_peak < 2 * small_peak + 65536  # Independent of the file size
+
+    def test_bounded_memory_leading_comment(self, tmp_path):
+        small_file, large_file = tmp_path / 'small.C', tmp_path / 'large.C'
+        small_file.write_text('// License text\n' * 2000 + '\n' + self.block)
+        large_file.write_text('// License text\n' * 100000 + '\n' + self.block)  # ~1.6MB in a single comment run
+
+        small_sink, large_sink = _CountingSink(), _CountingSink()
+        small_peak = self._peak_memory(small_file, small_sink)
+        large_peak = self._peak_memory(large_file, large_sink)
+        assert large_sink.num_chars > 1500000
+        assert large_peak < 2 * small_peak + 65536
+
+    def test_spilled_comment_run(self, monkeypatch):
+        code = '// License\n' * 5 + '#include <b>\n#include <a>\n\n' + '/* x */\n' * 5 + '\nint x;\n'
+        expected = arrange_code(code, 'mom.C', '/home/john/work/')
+        monkeypatch.setattr(IncludeArranger, 'max_buffered_lines', 2)
+        assert expected == arrange_code(code, 'mom.C', '/home/john/work/')
+        assert '#include <a>\n#include <b> // License License License License License' == expected.split('\n\n')[0]
+
+    def test_chunked_writer(self):
+        stream = io.StringIO()
+        writer = ChunkedWriter(stream, chunk_size=4)
+        writer.write('ab')
+        assert '' == stream.getvalue()
+        writer.write('cd')
+        writer.write('e')
+        assert 'abcd' == stream.getvalue()
+        writer.flush()
+        assert 'abcde' == stream.getvalue()
+
+
+########################################################################################################################
+
+
+class TestEditRecording:
+
+    code = '''// header
+#include <vector>
+#include <iostream>
+
+int a;
+
+#include <string> // tidy
+int b;
+/* some
+   comment */
+#include "b.H"
+#include "a.H"
+'''
+
+    def test_edits(self):
+        lines = io.StringIO(self.code).readlines()
+        edits = arrange_edits(lines, 'mom.C', '/home/john/work/')
+        assert [Edit(1, ['// header\n', '#include <vector>\n', '#include <iostream>\n'],
+                     '#include <iostream>\n#include <vector> // header\n'),
+                Edit(9, ['/* some\n', '   comment */\n', '#include "b.H"\n', '#include "a.H"\n'],
+                     '#include "a.H"\n#include "b.H" // some comment\n')] == edits
+        assert arrange_code(self.code, 'mom.C', '/home/john/work/') == apply_edits(lines, edits)
+
+    def test_no_edits(self):
+        code = arrange_code(self.code, 'mom.C', '/home/john/work/')
+        assert [] == arrange_edits(io.StringIO(code), 'mom.C', '/home/john/work/')
+        assert '' == unified_diff(io.StringIO(code).readlines(), [], 'mom.C')
+
+    def test_arrange_code_splits_only_at_line_breaks(self):
+        code = '#include <a>\n\f\nint x;\x0b // \x1c\x85\u2028\n'
+        assert code == arrange_code(code, 'mom.C', '/home/john/work/')
+        assert '#include <a>\n\nint x;\n' == arrange_code('#include <a>\r\n\r\nint x;\r\n', 'mom.C', '/')
+
+    def test_unified_diff(self, tmp_path):
+        lines = io.StringIO(self.code).readlines()
+        edits = arrange_edits(lines, 'mom.C', '/home/john/work/')
+        diff = unified_diff(lines, edits, 'mom.C')
+        assert diff.startswith('--- a/mom.C\n+++ b/mom.C\n@@ -1,12 +1,9 @@\n-// header\n')  # Context joins both edits
+        assert diff.endswith('+#include "b.H" // some comment\n')
+        if shutil.which('git'):  # The diff is accepted by git apply (which requires context lines by default)
+            (tmp_path / 'mom.C').write_text(self.code)
+            (tmp_path / 'mom.diff').write_text(diff)
+            subprocess.run(['git', 'apply', 'mom.diff'], cwd=str(tmp_path), check=True)
+            assert apply_edits(lines, edits) == (tmp_path / 'mom.C').read_text()
+
+        diff = unified_diff(lines, edits, 'mom.C', context=1)
+        assert '@@ -1,4 +1,3 @@\n-// header\n' in diff
+        assert '@@ -8,5 +7,3 @@\n int b;\n-/* some\n' in diff
+
+    def test_missing_final_newline(self):
+        edits = arrange_edits(['#include <a>\n', 'int x;'], 'mom.C', '/home/john/work/')
+        assert [Edit(2, ['int x;'], 'int x;\n')] == edits
+        assert '#include <a>\nint x;\n' == apply_edits(['#include <a>\n', 'int x;'], edits)
+
+
 # TODO: Test what happens on non-empty last line
 # TODO: Comments output stripped on both sides
 # TODO: Test with no/default arguments in IncludeArranger c'tor
@@ -0,0 +1,64 @@
+import os
+
+from tidycxx.batch import FIXED, TIDY, IncludeTool
+from tidycxx.watch import MtimeIndex, Watcher
+
+
+TIDY_CODE = '#include <iostream>\n'
+UNTIDY_CODE = '#include <vector>\n#include <iostream>\n'
+
+
+def _write(path, text, mtime_ns):
+    path.write_text(text)
+    os.utime(str(path), ns=(mtime_ns, mtime_ns))
+
+
+class TestWatching:
+
+    def test_index(self, tmp_path):
+        (tmp_path / 'sub').mkdir()
+        _write(tmp_path / 'sub' / 'a.C', TIDY_CODE, 10)
+        _write(tmp_path / 'b.txt', TIDY_CODE, 10)
+        index = MtimeIndex([str(tmp_path)])
+        assert [str(tmp_path / 'sub' / 'a.C')] == list(index.entries)
+
+        assert [] == index.changes()
+        _write(tmp_path / 'sub' / 'a.C', TIDY_CODE, 20)
+        _write(tmp_path / 'c.H', TIDY_CODE, 20)
+        assert [str(tmp_path / 'c.H'), str(tmp_path / 'sub' / 'a.C')] == index.changes()
+        assert [] == index.changes()
+
+    def test_debounce(self, tmp_path):
+        first, second = tmp_path / 'first.C', tmp_path / 'second.C'
+        _write(first, TIDY_CODE, 10)
+        _write(second, TIDY_CODE, 10)
+        watcher = Watcher([str(tmp_path)], IncludeTool(str(tmp_path)), debounce=1.0)
+
+        assert {} == watcher.poll(now=100.0)
+        _write(first, UNTIDY_CODE, 20)
+        assert {} == watcher.poll(now=101.0)  # Wait for more changes
+        _write(second, TIDY_CODE + '\n', 20)
+        assert {} == watcher.poll(now=101.5)
+        assert {str(first): FIXED, str(second): TIDY} == watcher.poll(now=102.5)
+        assert '#include <iostream>\n#include <vector>\n' == first.read_text()
+
+        assert {} == watcher.poll(now=110.0)  # Own modification isn't processed again
+
+    def test_saved_while_processing(self, tmp_path):
+        class SavingTool(IncludeTool):
+            def __call__(self, path, in_place, unchanged=None):
+                if not saved:
+                    saved.append(path)
+                    _write(tmp_path / 'mom.C', UNTIDY_CODE + '// saved\n', 30)
+                return IncludeTool.__call__(self, path, in_place, unchanged=unchanged)
+
+        saved = []
+        _write(tmp_path / 'mom.C', TIDY_CODE, 10)
+        watcher = Watcher([str(tmp_path)], SavingTool(str(tmp_path)), debounce=1.0)
+        _write(tmp_path / 'mom.C', UNTIDY_CODE, 20)
+        assert {} == watcher.poll(now=100.0)
+        assert {} == watcher.poll(now=101.5)  # Skipped and requeued
+        assert UNTIDY_CODE + '// saved\n' == (tmp_path / 'mom.C').read_text()
+        assert {} == watcher.poll(now=102.0)
+        assert {str(tmp_path / 'mom.C'): FIXED} == watcher.poll(now=103.0)
+        assert '#include <iostream>\n#include <vector>\n// saved\n' == (tmp_path / 'mom.C').read_text()